@@ -154,10 +154,81 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "users.authentication.CachedTokenAuthentication",
     ),
 }
 
+# exact | cached | estimated
+PAGINATION_COUNT_STRATEGY = os.environ.get(
+    "PAGINATION_COUNT_STRATEGY", default="exact"
+)
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.environ.get("PAGINATION_COUNT_CACHE_TIMEOUT", default=60)
+)
+
+# The default LocMemCache is private to each worker process. Set
+# CACHE_BACKEND to a shared one (memcached, or DatabaseCache after
+# "manage.py createcachetable") for settings that rely on sharing.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", default=""),
+    }
+}
+
+TOKEN_CACHE_TIMEOUT = int(os.environ.get("TOKEN_CACHE_TIMEOUT", default=60))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", default=1024))
+# Keep tokens in Django's cache instead of a per-process LRU. Revocation
+# reaches every worker at once only when CACHE_BACKEND is shared,
+# otherwise other workers accept a revoked token for up to
+# TOKEN_CACHE_TIMEOUT seconds.
+TOKEN_CACHE_SHARED = (
+    os.environ.get("TOKEN_CACHE_SHARED", default="false").lower() == "true"
+)
+
+SHOPPING_CART_CLEAR_ON_DOWNLOAD = (
+    os.environ.get("SHOPPING_CART_CLEAR_ON_DOWNLOAD", default="true").lower()
+    == "true"
+)
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.environ.get("SHOPPING_LIST_CACHE_TIMEOUT", default=60 * 60)
+)
+
+# Favorites older than the window do not count towards popularity.
+RECIPE_RANK_WINDOW_DAYS = int(
+    os.environ.get("RECIPE_RANK_WINDOW_DAYS", default=30)
+)
+RECIPE_RANK_HALF_LIFE_DAYS = int(
+    os.environ.get("RECIPE_RANK_HALF_LIFE_DAYS", default=7)
+)
+
+# Seconds between checks of the shared version of the in-process
+# ingredient and coverage indexes.
+INDEX_VERSION_TTL = float(os.environ.get("INDEX_VERSION_TTL", default=5))
+
+SIMILAR_RECIPES_INDEX = os.environ.get(
+    "SIMILAR_RECIPES_INDEX",
+    default=os.path.join(BASE_DIR, "var", "similar_recipes.idx"),
+)
+SIMILAR_RECIPES_LIMIT = 10
+# Upper bound of recipes ranked by ?have= ingredient coverage.
+COVERAGE_SEARCH_LIMIT = 1000
+
+# Processes rendering recipe image variants, 0 renders in the request.
+IMAGE_PROCESSING_WORKERS = int(
+    os.environ.get("IMAGE_PROCESSING_WORKERS", default=2)
+)
+# Limits of PUT /api/recipes/{id}/image/, checked before decoding.
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.environ.get("RECIPE_IMAGE_MAX_SIZE", default=10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.environ.get("RECIPE_IMAGE_MAX_PIXELS", default=40_000_000)
+)
+
 
 CORS_ORIGIN_ALLOW_ALL = True
 
@@ -174,3 +245,8 @@ EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 EMAIL_PORT = os.environ.get("EMAIL_PORT")
 EMAIL_TIMEOUT = 5
+EMAIL_QUEUE_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled after every failed attempt.
+EMAIL_QUEUE_RETRY_DELAY = 60
+# Seconds a batch claimed by a worker stays hidden from the others.
+EMAIL_QUEUE_CLAIM_TIMEOUT = 600
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -131,10 +132,24 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "users.authentication.CachedTokenAuthentication",
     ),
 }
 
+SHOPPING_CART_CLEAR_ON_DOWNLOAD = True
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+RECIPE_RANK_WINDOW_DAYS = 30
+RECIPE_RANK_HALF_LIFE_DAYS = 7
+INDEX_VERSION_TTL = 0
+SIMILAR_RECIPES_INDEX = os.path.join(
+    tempfile.gettempdir(), "foodgram", "similar_recipes.idx"
+)
+SIMILAR_RECIPES_LIMIT = 10
+COVERAGE_SEARCH_LIMIT = 1000
+IMAGE_PROCESSING_WORKERS = 0
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+
 
 CORS_ORIGIN_ALLOW_ALL = True
 
@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.contrib.admin import register
+from django.db import transaction
 from django.utils.html import format_html
 
+from recipes.images import image_pipeline
 from recipes.models import Cart, Favorite, Ingredient, Recipe, RecipeTag
+from recipes.search import update_search_index
 
 
 class IngridientItemAdmin(admin.StackedInline):
@@ -18,6 +21,7 @@ class RecipeAdmin(admin.ModelAdmin):
         "author",
         "name",
         "cooking_time",
+        "favorites_count",
         "image_list_preview",
     ]
     exclude = ["ingredients"]
@@ -27,6 +31,18 @@ class RecipeAdmin(admin.ModelAdmin):
 
     readonly_fields = ("image_change_preview",)
 
+    def save_model(self, request, obj, form, change):
+        new_image = "image" in form.changed_data
+        if new_image:
+            obj.image_variants = {}
+        super().save_model(request, obj, form, change)
+        if new_image:
+            transaction.on_commit(lambda: image_pipeline.schedule(obj.pk))
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_index([form.instance.pk])
+
     def image_change_preview(self, obj):
         if obj.image:
             url = obj.image.url
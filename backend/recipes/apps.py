@@ -5,3 +5,14 @@ class RecipesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "recipes"
     verbose_name = "Рецепты"
+
+    def ready(self):
+        import recipes.coverage  # noqa: F401
+        import recipes.images  # noqa: F401
+        import recipes.ingredient_index  # noqa: F401
+        import recipes.search  # noqa: F401
+        import recipes.signals  # noqa: F401
+        import recipes.similarity  # noqa: F401
+        from recipes.renderers import register_fonts
+
+        register_fonts()
@@ -0,0 +1,281 @@
+import math
+import threading
+import uuid
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import CoverageChange, IngredientItem
+from recipes.versioning import VersionedIndex
+
+# Change ids committed out of order are still picked up within the
+# window, more changed recipes than the batch reload the whole index.
+CHANGES_WINDOW = 100
+CHANGES_BATCH = 500
+CHANGES_KEPT = 10000
+
+
+def make_bitmap(positions, size):
+    bits = bytearray(size // 8 + 1)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+def get_mask(width):
+    return (1 << (width // 8 + 1) * 8) - 1
+
+
+def iter_bits(bitmap):
+    # Bits are read from the binary string so the scan stays in C.
+    digits = bin(bitmap)[:1:-1]
+    position = digits.find("1")
+    while position != -1:
+        yield position
+        position = digits.find("1", position + 1)
+
+
+def add_bitmap(planes, bitmap):
+    # Bit-sliced counter: planes[i] holds bit i of every recipe's count.
+    carry = bitmap
+    for index, plane in enumerate(planes):
+        planes[index], carry = plane ^ carry, plane & carry
+        if not carry:
+            return
+    planes.append(carry)
+
+
+def equals(planes, value, mask):
+    result = mask
+    for index, plane in enumerate(planes):
+        result &= plane if value >> index & 1 else plane ^ mask
+    return result
+
+
+class CoverageIndex(VersionedIndex):
+    name = "coverage"
+
+    def __init__(self):
+        super().__init__()
+        self.postings = {}
+        self.sizes = {}
+        self.mask = 0
+        self.width = 0
+        self.recipes = {}
+        self.anchor = None
+        self.seen = set()
+
+    def reload(self):
+        if self.anchor is not None and self.reload_changes():
+            return
+        changes = list(
+            CoverageChange.objects.order_by("-id").values_list(
+                "id", "version", "recipe_id"
+            )[:CHANGES_WINDOW]
+        )
+        self.load(
+            IngredientItem.objects.order_by("ingredient_id")
+            .values_list("ingredient_id", "recipe_id")
+            .iterator()
+        )
+        self.track(changes)
+
+    def reload_changes(self):
+        # Only recipes changed since the last load are read again, the
+        # log must still hold the last applied change.
+        changes = list(
+            CoverageChange.objects.filter(
+                id__gte=self.anchor[0] - CHANGES_WINDOW
+            )
+            .order_by("id")
+            .values_list("id", "version", "recipe_id")
+        )
+        if self.anchor not in {
+            (change_id, version) for change_id, version, _ in changes
+        }:
+            return False
+        recipe_ids = {
+            recipe_id
+            for change_id, _, recipe_id in changes
+            if change_id not in self.seen
+        }
+        if not recipe_ids:
+            # An invalidate() without logged changes reloads everything.
+            versions = {version for _, version, _ in changes}
+            return self.get_version() in versions
+        if len(recipe_ids) > CHANGES_BATCH:
+            return False
+        recipe_ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in IngredientItem.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list("recipe_id", "ingredient_id"):
+            recipe_ingredients[recipe_id].append(ingredient_id)
+        self.update(recipe_ingredients)
+        self.track(changes)
+        return True
+
+    def track(self, changes):
+        self.seen = {change_id for change_id, _, _ in changes}
+        if changes:
+            change_id, version, _ = max(changes)
+            self.anchor = (change_id, version)
+        else:
+            self.anchor = None
+
+    def load(self, rows):
+        # rows are (ingredient_id, recipe_id) pairs sorted by ingredient
+        recipes = defaultdict(list)
+        postings = {}
+        groups = groupby(rows, key=itemgetter(0))
+        grouped = [
+            (ingredient_id, [recipe_id for _, recipe_id in items])
+            for ingredient_id, items in groups
+        ]
+        width = max((max(recipe_ids) for _, recipe_ids in grouped), default=0)
+        for ingredient_id, recipe_ids in grouped:
+            postings[ingredient_id] = make_bitmap(recipe_ids, width)
+            for recipe_id in recipe_ids:
+                recipes[recipe_id].append(ingredient_id)
+
+        size_recipes = defaultdict(list)
+        for recipe_id, ingredient_ids in recipes.items():
+            size_recipes[len(ingredient_ids)].append(recipe_id)
+        sizes = {
+            size: make_bitmap(recipe_ids, width)
+            for size, recipe_ids in size_recipes.items()
+        }
+        self.recipes = {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+        self.postings, self.sizes, self.mask, self.width = (
+            postings,
+            sizes,
+            get_mask(width),
+            width,
+        )
+
+    def update(self, recipe_ingredients):
+        # recipe_ingredients maps recipe ids to their current ingredients,
+        # none for a removed recipe. match() may be reading the bitmaps,
+        # so the dicts are copied rather than changed in place.
+        postings, sizes, width = dict(self.postings), dict(self.sizes), 0
+        for recipe_id, ingredient_ids in recipe_ingredients.items():
+            bit = 1 << recipe_id
+            previous = self.recipes.pop(recipe_id, ())
+            for ingredient_id in previous:
+                postings[ingredient_id] &= ~bit
+                if not postings[ingredient_id]:
+                    del postings[ingredient_id]
+            if previous:
+                sizes[len(previous)] &= ~bit
+                if not sizes[len(previous)]:
+                    del sizes[len(previous)]
+            if not ingredient_ids:
+                continue
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id] = postings.get(ingredient_id, 0) | bit
+            size = len(ingredient_ids)
+            sizes[size] = sizes.get(size, 0) | bit
+            self.recipes[recipe_id] = tuple(ingredient_ids)
+            width = max(width, recipe_id)
+        width = max(width, self.width)
+        self.postings, self.sizes, self.mask, self.width = (
+            postings,
+            sizes,
+            get_mask(width),
+            width,
+        )
+
+    def search(self, ingredient_ids, coverage=1.0, limit=None, allowed=None):
+        self.refresh()
+        return self.match(ingredient_ids, coverage, limit, allowed)
+
+    def match(self, ingredient_ids, coverage=1.0, limit=None, allowed=None):
+        postings, sizes, mask, width = (
+            self.postings,
+            self.sizes,
+            self.mask,
+            self.width,
+        )
+        if allowed is not None:
+            # Filter before the limit, so it cannot cut filtered matches.
+            mask &= make_bitmap(
+                (recipe_id for recipe_id in allowed if recipe_id <= width),
+                width,
+            )
+        planes = []
+        for ingredient_id in set(ingredient_ids):
+            if ingredient_id in postings:
+                add_bitmap(planes, postings[ingredient_id])
+        if not planes:
+            return []
+
+        groups = []
+        most = (1 << len(planes)) - 1
+        for size, recipes in sizes.items():
+            least = max(1, math.ceil(coverage * size - 1e-9))
+            for matched in range(least, min(size, most) + 1):
+                found = equals(planes, matched, mask) & recipes
+                if found:
+                    groups.append((matched / size, found))
+
+        result = [
+            (recipe_id, score)
+            for score, found in groups
+            for recipe_id in iter_bits(found)
+        ]
+        result.sort(key=lambda item: (-item[1], -item[0]))
+        return result[:limit]
+
+
+coverage_index = CoverageIndex()
+_pending = threading.local()
+
+
+def flush_coverage_changes():
+    recipe_ids = getattr(_pending, "recipe_ids", None)
+    _pending.recipe_ids = None
+    if not recipe_ids:
+        return
+    version = uuid.uuid4().hex
+    CoverageChange.objects.bulk_create(
+        CoverageChange(recipe_id=recipe_id, version=version)
+        for recipe_id in recipe_ids
+    )
+    last = (
+        CoverageChange.objects.order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    CoverageChange.objects.filter(id__lte=last - CHANGES_KEPT).delete()
+    coverage_index.invalidate(version)
+
+
+def mark_recipes_changed(recipe_ids):
+    # Changes are collected per transaction and logged by one on_commit
+    # callback for each savepoint level, the first one to run takes them
+    # all. No callback left queued means the last transaction ended.
+    connection = transaction.get_connection()
+    queued = [
+        item[0]
+        for item in connection.run_on_commit
+        if item[1] is flush_coverage_changes
+    ]
+    pending = getattr(_pending, "recipe_ids", None)
+    if pending is None or not queued:
+        pending = _pending.recipe_ids = set()
+        queued = []
+    pending.update(recipe_ids)
+    if set(connection.savepoint_ids) not in queued:
+        transaction.on_commit(flush_coverage_changes)
+
+
+@receiver(post_save, sender=IngredientItem)
+@receiver(post_delete, sender=IngredientItem)
+def mark_coverage_recipe(sender, instance, **kwargs):
+    mark_recipes_changed([instance.recipe_id])
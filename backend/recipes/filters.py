@@ -2,6 +2,8 @@ from django.contrib.auth import get_user_model
 from django_filters import rest_framework as filters
 
 from recipes.models import Ingredient, RecipeTag
+from recipes.ranking import ORDERING_CHOICES, order_recipes
+from recipes.search import search_recipes
 
 User = get_user_model()
 
@@ -24,3 +26,13 @@ class RecipeFilter(filters.FilterSet):
         to_field_name="slug",
     )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
+    search = filters.CharFilter(method="search_by_text")
+    ordering = filters.ChoiceFilter(
+        choices=ORDERING_CHOICES, method="order_by"
+    )
+
+    def order_by(self, queryset, name, value):
+        return order_recipes(queryset, value)
+
+    def search_by_text(self, queryset, name, value):
+        return search_recipes(queryset, value)
@@ -0,0 +1,154 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+
+from recipes.models import ImageBlob, Recipe
+from recipes.storage import lock_blob, recipe_image_storage
+from recipes.thumbnails import FORMATS, VARIANTS, render_variants
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = "recipes/variants"
+
+
+def get_image_url(recipe, variant, request=None):
+    accept = request.META.get("HTTP_ACCEPT", "") if request else ""
+    extension = "webp" if "image/webp" in accept else "jpeg"
+    name = recipe.image_variants.get(variant, {}).get(extension)
+    if name:
+        url = default_storage.url(name)
+    elif recipe.image:
+        url = recipe.image.url
+    else:
+        return None
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def get_variant_names(source):
+    # Derived from the source name, so they are known without a query.
+    stem = os.path.splitext(os.path.basename(source))[0]
+    directory = os.path.join(VARIANTS_DIR, stem[:2], stem[2:4])
+    return {
+        variant: {
+            extension: os.path.join(directory, f"{stem}_{variant}.{extension}")
+            for extension in FORMATS
+        }
+        for variant in VARIANTS
+    }
+
+
+@transaction.atomic
+def release_image(name):
+    # A blob is referenced by every recipe that has it as the image.
+    lock_blob(name)
+    if Recipe.objects.filter(image=name).exists():
+        return
+    recipe_image_storage.delete(name)
+    for formats in get_variant_names(name).values():
+        for variant_name in formats.values():
+            default_storage.delete(variant_name)
+    ImageBlob.objects.filter(name=name).delete()
+
+
+class ImagePipeline:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                # spawn keeps forked Django state out of the workers
+                self.executor = ProcessPoolExecutor(
+                    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self.executor
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def schedule(self, recipe_id):
+        recipe = Recipe.objects.only("image").get(pk=recipe_id)
+        if not recipe.image:
+            return None
+        source = recipe.image.name
+        names = get_variant_names(source)
+        if all(
+            default_storage.exists(name)
+            for formats in names.values()
+            for name in formats.values()
+        ):
+            # The same image was already uploaded for another recipe.
+            self.store(recipe_id, source, {})
+            return None
+
+        path = recipe.image.path
+        if not settings.IMAGE_PROCESSING_WORKERS:
+            self.store(recipe_id, source, render_variants(path))
+            return None
+        future = self.get_executor().submit(render_variants, path)
+        future.add_done_callback(partial(self.on_done, recipe_id, source))
+        return future
+
+    def on_done(self, recipe_id, source, future):
+        try:
+            self.store(recipe_id, source, future.result())
+        except Exception:
+            logger.exception("Image variants failed for recipe %s", recipe_id)
+        finally:
+            connections.close_all()
+
+    def store(self, recipe_id, source, variants):
+        paths = get_variant_names(source)
+        for variant, formats in variants.items():
+            for extension, content in formats.items():
+                name = paths[variant][extension]
+                if not default_storage.exists(name):
+                    paths[variant][extension] = default_storage.save(
+                        name, ContentFile(content)
+                    )
+        # The image may have been replaced while variants were rendered.
+        Recipe.objects.filter(pk=recipe_id, image=source).update(
+            image_variants=paths
+        )
+
+
+image_pipeline = ImagePipeline()
+
+
+@receiver(pre_save, sender=Recipe)
+def release_replaced_image(sender, instance, raw, using, **kwargs):
+    # The new file is not committed until the field saves it.
+    if raw or instance.pk is None or instance.image._committed:
+        return
+    previous = (
+        Recipe.objects.using(using)
+        .filter(pk=instance.pk)
+        .values_list("image", flat=True)
+        .first()
+    )
+    if previous:
+        transaction.on_commit(lambda: release_image(previous), using=using)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, using, **kwargs):
+    name = instance.image.name
+    if name:
+        transaction.on_commit(lambda: release_image(name), using=using)
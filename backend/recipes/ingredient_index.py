@@ -0,0 +1,46 @@
+import bisect
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient
+from recipes.versioning import VersionedIndex
+
+
+class IngredientIndex(VersionedIndex):
+    name = "ingredients"
+
+    def __init__(self):
+        super().__init__()
+        self.names = []
+        self.rows = []
+
+    def reload(self):
+        rows = sorted(
+            Ingredient.objects.values("id", "name", "measurement_unit"),
+            key=lambda row: row["name"],
+        )
+        self.names = [row["name"] for row in rows]
+        self.rows = rows
+
+    def search(self, prefix, limit=None):
+        self.refresh()
+        names, rows = self.names, self.rows
+        result = []
+        position = bisect.bisect_left(names, prefix)
+        while position < len(names) and names[position].startswith(prefix):
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(rows[position])
+            position += 1
+        return result
+
+
+ingredient_index = IngredientIndex()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.coverage import CoverageIndex
+
+
+def scan(recipes, ingredient_ids, coverage, limit):
+    have = set(ingredient_ids)
+    result = []
+    for recipe_id, ingredients in recipes.items():
+        matched = len(ingredients & have)
+        score = matched / len(ingredients)
+        if matched and score >= coverage - 1e-9:
+            result.append((recipe_id, score))
+    result.sort(key=lambda item: (-item[1], -item[0]))
+    return result[:limit]
+
+
+class Command(BaseCommand):
+    help = "Benchmark ?have= coverage search on a synthetic catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=100000)
+        parser.add_argument("--ingredients", type=int, default=2000)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--coverage", type=int, default=80)
+        parser.add_argument("--seed", type=int, default=2021)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        # a few staple ingredients are used far more often than the rest
+        weights = [1 / (rank + 1) for rank in range(options["ingredients"])]
+        population = range(1, options["ingredients"] + 1)
+        recipes = {
+            recipe_id: set(
+                rng.choices(population, weights, k=rng.randint(3, 12))
+            )
+            for recipe_id in range(1, options["recipes"] + 1)
+        }
+        queries = [
+            rng.choices(population, weights, k=rng.randint(10, 40))
+            for _ in range(options["queries"])
+        ]
+        coverage = options["coverage"] / 100
+
+        started = time.perf_counter()
+        index = CoverageIndex()
+        index.load(
+            sorted(
+                (ingredient_id, recipe_id)
+                for recipe_id, ingredients in recipes.items()
+                for ingredient_id in ingredients
+            )
+        )
+        build = time.perf_counter() - started
+
+        timings = {"index": 0, "scan": 0}
+        for query in queries:
+            started = time.perf_counter()
+            found = index.match(query, coverage, 1000)
+            timings["index"] += time.perf_counter() - started
+            started = time.perf_counter()
+            expected = scan(recipes, query, coverage, 1000)
+            timings["scan"] += time.perf_counter() - started
+            if found != expected:
+                raise AssertionError(f"Index mismatch for query {query}")
+
+        count = len(queries)
+        self.stdout.write(
+            f"{options['recipes']} recipes, "
+            f"{options['ingredients']} ingredients, {count} queries"
+        )
+        self.stdout.write(f"index build: {build * 1000:.1f} ms")
+        for name, total in timings.items():
+            self.stdout.write(
+                f"{name}: {total / count * 1000:.2f} ms per query"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "speedup: {:.1f}x".format(timings["scan"] / timings["index"])
+            )
+        )
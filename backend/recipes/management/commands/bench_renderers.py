@@ -0,0 +1,68 @@
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from recipes.renderers import FONT_FILE, FONT_NAME, register_fonts, render_pdf
+
+
+def render_registering_font(ingredients):
+    # what every download did before the font was registered at startup
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_FILE, "UTF-8"))
+    render_pdf(ingredients, BytesIO())
+
+
+def render_registered_font(ingredients):
+    render_pdf(ingredients, BytesIO())
+
+
+class Command(BaseCommand):
+    help = "Benchmark the shopping list PDF with and without font loading"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=30)
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        register_fonts()
+        ingredients = [
+            {
+                "name": f"Ингредиент {i}",
+                "measurement_unit": "г",
+                "total": i * 10,
+            }
+            for i in range(1, options["lines"] + 1)
+        ]
+        renders = {
+            "register per request": render_registering_font,
+            "registered once": render_registered_font,
+        }
+
+        timings = {}
+        for name, render in renders.items():
+            best = None
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                for _ in range(options["iterations"]):
+                    render(ingredients)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best / options["iterations"]
+
+        self.stdout.write(
+            f"{options['lines']} lines, {options['iterations']} iterations, "
+            f"best of {options['repeat']}"
+        )
+        for name, average in timings.items():
+            self.stdout.write(f"{name}: {average * 1000:.2f} ms per render")
+        self.stdout.write(
+            self.style.SUCCESS(
+                "speedup: {:.1f}x".format(
+                    timings["register per request"]
+                    / timings["registered once"]
+                )
+            )
+        )
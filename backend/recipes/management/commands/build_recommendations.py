@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.recommendations import build_neighbours
+
+
+class Command(BaseCommand):
+    help = "Rebuild co-favorite recipe neighbours for recommendations"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=20)
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = build_neighbours(options["top_k"], options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} neighbours"))
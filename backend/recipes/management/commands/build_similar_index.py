@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import similar_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the similar recipes index from scratch"
+
+    def handle(self, *args, **options):
+        count = similar_index.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {count} recipes in {similar_index.path}"
+            )
+        )
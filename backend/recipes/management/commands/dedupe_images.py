@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.images import release_image
+from recipes.models import Recipe
+from recipes.storage import recipe_image_storage
+
+
+class Command(BaseCommand):
+    help = "Move recipe images to content-addressed names, dropping copies"
+
+    def handle(self, *args, **options):
+        names = list(
+            Recipe.objects.exclude(image="")
+            .order_by()
+            .values_list("image", flat=True)
+            .distinct()
+        )
+        moved = 0
+        for name in names:
+            if not recipe_image_storage.exists(name):
+                continue
+            with transaction.atomic():
+                with recipe_image_storage.open(name) as image:
+                    hashed = recipe_image_storage.save(name, image)
+                if hashed == name:
+                    continue
+                Recipe.objects.filter(image=name).update(
+                    image=hashed, image_variants={}
+                )
+            release_image(name)
+            moved += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved {moved} of {len(names)} images, "
+                "run process_images to render their variants"
+            )
+        )
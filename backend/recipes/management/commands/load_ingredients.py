@@ -0,0 +1,106 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+DEFAULT_PATH = Path(settings.BASE_DIR) / "data" / "ingredients.csv"
+
+
+def read_csv(path):
+    with open(path, encoding="utf-8", newline="") as file:
+        for row in csv.reader(file):
+            if row:
+                yield row[0].strip(), row[1].strip()
+
+
+def read_json(path):
+    with open(path, encoding="utf-8") as file:
+        for item in json.load(file):
+            yield item["title"].strip(), item["dimension"].strip()
+
+
+READERS = {
+    ".csv": read_csv,
+    ".json": read_json,
+}
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
+
+
+class Command(BaseCommand):
+    help = "Load ingredients from data/ingredients.csv or .json"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=str(DEFAULT_PATH),
+            help="CSV (name,unit) or JSON ([{title, dimension}]) file",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows per INSERT",
+        )
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help="Update measurement units of existing ingredients",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f"Unsupported file format: {path.suffix}")
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+
+        started = time.perf_counter()
+        total = 0
+        with transaction.atomic():
+            for chunk in chunks(reader(path), options["batch_size"]):
+                rows = dict(chunk)
+                if options["update"]:
+                    self.update_existing(rows)
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in rows.items()
+                    ],
+                    ignore_conflicts=True,
+                )
+                total += len(chunk)
+            transaction.on_commit(ingredient_index.invalidate)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} ingredients processed in {elapsed:.2f}s "
+                f"({total / elapsed:.0f} rows/s)"
+            )
+        )
+
+    def update_existing(self, rows):
+        changed = []
+        for ingredient in Ingredient.objects.filter(name__in=rows):
+            unit = rows.pop(ingredient.name)
+            if ingredient.measurement_unit != unit:
+                ingredient.measurement_unit = unit
+                changed.append(ingredient)
+        Ingredient.objects.bulk_update(changed, ["measurement_unit"])
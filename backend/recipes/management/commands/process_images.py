@@ -0,0 +1,41 @@
+from concurrent.futures import wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import image_pipeline
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Render image variants for recipes that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Render variants again for every recipe",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image="").order_by("id")
+        if not options["all"]:
+            recipes = recipes.filter(image_variants={})
+        # keep only a few renders queued at a time
+        batch_size = max(settings.IMAGE_PROCESSING_WORKERS, 1) * 4
+        recipe_ids = list(recipes.values_list("id", flat=True))
+        try:
+            for start in range(0, len(recipe_ids), batch_size):
+                end = start + batch_size
+                futures = [
+                    image_pipeline.schedule(recipe_id)
+                    for recipe_id in recipe_ids[start:end]
+                ]
+                wait([future for future in futures if future is not None])
+        finally:
+            image_pipeline.shutdown()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed images of {len(recipe_ids)} recipes"
+            )
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ranking import refresh_recipe_ranks
+
+
+class Command(BaseCommand):
+    help = "Refresh the popular recipes ranking"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created, updated, removed = refresh_recipe_ranks(
+            batch_size=options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ranks created: {created}, updated: {updated}, "
+                f"removed: {removed}"
+            )
+        )
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import count_subquery
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Profile, Subscription
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Recalculate denormalized recipe and profile counters"
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        Profile.objects.bulk_create(
+            [
+                Profile(user_id=user_id)
+                for user_id in User.objects.filter(
+                    profile__isnull=True
+                ).values_list("id", flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+        recipes = Recipe.objects.update(
+            favorites_count=count_subquery(Favorite, "recipe"),
+            in_carts_count=count_subquery(Cart, "recipe"),
+        )
+        profiles = Profile.objects.update(
+            recipes_count=count_subquery(Recipe, "author", outer="user"),
+            followers_count=count_subquery(
+                Subscription, "author", outer="user"
+            ),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recounted {recipes} recipes and {profiles} profiles"
+            )
+        )
@@ -0,0 +1,72 @@
+# Generated by Django 3.2.5 on 2026-10-18 19:22
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS recipe_search_vector_idx "
+    "ON recipes_recipe USING GIN (search_vector)",
+    "UPDATE recipes_recipe recipe SET search_vector = "
+    "setweight(to_tsvector('russian', recipe.name), 'A') || "
+    "setweight(to_tsvector('russian', COALESCE(("
+    "SELECT string_agg(ingredient.name, ' ') "
+    "FROM recipes_ingredientitem item "
+    "JOIN recipes_ingredient ingredient "
+    "ON ingredient.id = item.ingredient_id "
+    "WHERE item.recipe_id = recipe.id), '')), 'B') || "
+    "setweight(to_tsvector('russian', recipe.text), 'C')",
+]
+POSTGRES_BACKWARD = ["DROP INDEX IF EXISTS recipe_search_vector_idx"]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts "
+    "USING fts5(name, ingredients, text, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) "
+    "SELECT recipe.id, recipe.name, "
+    "COALESCE(GROUP_CONCAT(ingredient.name, ' '), ''), recipe.text "
+    "FROM recipes_recipe recipe "
+    "LEFT JOIN recipes_ingredientitem item ON item.recipe_id = recipe.id "
+    "LEFT JOIN recipes_ingredient ingredient "
+    "ON ingredient.id = item.ingredient_id "
+    "GROUP BY recipe.id",
+]
+SQLITE_BACKWARD = ["DROP TABLE IF EXISTS recipes_recipe_fts"]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_neighbours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run(
+                {
+                    "postgresql": POSTGRES_FORWARD,
+                    "sqlite": SQLITE_FORWARD,
+                }
+            ),
+            run(
+                {
+                    "postgresql": POSTGRES_BACKWARD,
+                    "sqlite": SQLITE_BACKWARD,
+                }
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.5 on 2026-10-18 19:41
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, storage=recipes.storage.HashedStorage(), upload_to='recipes/', verbose_name='Изображение'),
+        ),
+    ]
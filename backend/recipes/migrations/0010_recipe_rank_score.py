@@ -0,0 +1,43 @@
+# Generated by Django 3.2.5 on 2026-10-18 20:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def copy_scores(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    RecipeRank = apps.get_model("recipes", "RecipeRank")
+    Recipe.objects.update(
+        rank_score=Coalesce(
+            Subquery(
+                RecipeRank.objects.filter(recipe=OuterRef("pk")).values(
+                    "score"
+                )
+            ),
+            0.0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rank_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.RunPython(copy_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-rank_score', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.DeleteModel(
+            name='RecipeRank',
+        ),
+    ]
@@ -1,9 +1,11 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
 from recipes.slugify import slugify
+from recipes.storage import recipe_image_storage
 
 User = get_user_model()
 
@@ -19,7 +21,15 @@ class Recipe(models.Model):
         verbose_name="Ингредиенты",
     )
     tags = models.ManyToManyField("RecipeTag", verbose_name="Теги")
-    image = models.ImageField(upload_to="recipes/", verbose_name="Изображение")
+    image = models.ImageField(
+        upload_to="recipes/",
+        storage=recipe_image_storage,
+        db_index=True,
+        verbose_name="Изображение",
+    )
+    image_variants = models.JSONField(
+        default=dict, editable=False, verbose_name="Варианты изображения"
+    )
     name = models.CharField(max_length=200, verbose_name="Название")
     text = models.TextField(verbose_name="Описание")
     cooking_time = models.PositiveSmallIntegerField(
@@ -27,11 +37,29 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1)],
         verbose_name="Время приготовления",
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В избранном"
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В корзинах"
+    )
+    rank_score = models.FloatField(
+        default=0, editable=False, verbose_name="Популярность"
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ["-id"]
+        indexes = [
+            models.Index(
+                fields=["cooking_time", "-id"], name="recipe_quick_idx"
+            ),
+            models.Index(
+                fields=["-rank_score", "-id"], name="recipe_popular_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -59,10 +87,10 @@ class RecipeTag(models.Model):
 
 class Ingredient(models.Model):
     name = models.CharField(
-        max_length=50, unique=True, verbose_name="Название"
+        max_length=200, unique=True, verbose_name="Название"
     )
     measurement_unit = models.CharField(
-        max_length=5, verbose_name="Единица измерения"
+        max_length=200, verbose_name="Единица измерения"
     )
 
     class Meta:
@@ -109,6 +137,9 @@ class Favorite(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, verbose_name="Рецепт"
     )
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name="Дата добавления"
+    )
 
     class Meta:
         verbose_name = "Избранное"
@@ -119,6 +150,9 @@ class Favorite(models.Model):
                 fields=["user", "recipe"], name="unique_favorite"
             )
         ]
+        indexes = [
+            models.Index(fields=["created"], name="favorite_created_idx")
+        ]
 
     def __str__(self):
         return "Пользователь {} рецепт {}".format(
@@ -154,3 +188,79 @@ class Cart(models.Model):
         return "Пользователь {} рецепт {}".format(
             self.user.username, self.recipe.name
         )
+
+
+class RecipeNeighbour(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="neighbours",
+        verbose_name="Рецепт",
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="neighbour_of",
+        verbose_name="Похожий рецепт",
+    )
+    score = models.FloatField(verbose_name="Сходство")
+
+    class Meta:
+        verbose_name = "Соседний рецепт"
+        verbose_name_plural = "Соседние рецепты"
+        ordering = ["recipe", "-score"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "neighbour"], name="unique_neighbour"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["recipe", "-score"], name="recipe_neighbour_idx"
+            ),
+            models.Index(
+                fields=["neighbour", "recipe"], name="neighbour_recipe_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return "Рецепт {} сосед {}".format(self.recipe_id, self.neighbour_id)
+
+
+class IndexVersion(models.Model):
+    name = models.CharField(
+        max_length=50, primary_key=True, verbose_name="Индекс"
+    )
+    version = models.CharField(max_length=32, verbose_name="Версия")
+
+    class Meta:
+        verbose_name = "Версия индекса"
+        verbose_name_plural = "Версии индексов"
+
+    def __str__(self):
+        return "{} {}".format(self.name, self.version)
+
+
+class CoverageChange(models.Model):
+    recipe_id = models.PositiveIntegerField(verbose_name="Рецепт")
+    version = models.CharField(max_length=32, verbose_name="Версия")
+
+    class Meta:
+        verbose_name = "Изменение состава рецепта"
+        verbose_name_plural = "Изменения состава рецептов"
+
+    def __str__(self):
+        return "{} {}".format(self.recipe_id, self.version)
+
+
+class ImageBlob(models.Model):
+    name = models.CharField(
+        max_length=100, primary_key=True, verbose_name="Имя файла"
+    )
+
+    class Meta:
+        verbose_name = "Файл изображения"
+        verbose_name_plural = "Файлы изображений"
+
+    def __str__(self):
+        return self.name
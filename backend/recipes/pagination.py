@@ -1,8 +1,169 @@
-from rest_framework import pagination
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import (
+    EmptyResultSet,
+    FieldDoesNotExist,
+    ValidationError,
+)
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework import pagination, serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+COUNT_EXACT = "exact"
+COUNT_CACHED = "cached"
+COUNT_ESTIMATED = "estimated"
+
+
+class CountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        strategy = getattr(settings, "PAGINATION_COUNT_STRATEGY", COUNT_EXACT)
+        count = None
+        if not isinstance(self.object_list, QuerySet):
+            strategy = COUNT_EXACT
+        if strategy == COUNT_ESTIMATED:
+            count = self.get_estimated_count()
+        elif strategy == COUNT_CACHED:
+            count = self.get_cached_count()
+        if count is None:
+            count = super().count
+        return count
+
+    def get_estimated_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if queryset.query.has_filters() or connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] <= 0:
+            return None
+        return int(row[0])
+
+    def get_cached_count(self):
+        queryset = self.object_list.order_by().values("pk")
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return 0
+        key = "pagination-count:{}".format(
+            hashlib.md5(sql.encode()).hexdigest()
+        )
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(
+                key,
+                count,
+                getattr(settings, "PAGINATION_COUNT_CACHE_TIMEOUT", 60),
+            )
+        return count
 
 
 class CustomPagination(pagination.PageNumberPagination):
 
+    django_paginator_class = CountPaginator
     page_size = 10
     page_query_param = "page"
     page_size_query_param = "limit"
+
+
+class RecipePagination(CustomPagination):
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.keys = self.get_keys(queryset)
+        page_size = self.get_page_size(request)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(self.get_seek_filter(cursor))
+
+        ordering = [
+            f"-{field.name}" if descending else field.name
+            for field, descending in self.keys
+        ]
+        page = list(queryset.order_by(*ordering, "-id")[: page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_keys(self, queryset):
+        # Sort keys before the "-id" tie-break, they must be model fields
+        # so that the last row of a page can be written into the cursor.
+        ordering = list(queryset.query.order_by) or ["-id"]
+        if ordering[-1] != "-id":
+            raise serializers.ValidationError(
+                {"cursor": "Эта сортировка не поддерживает курсор."}
+            )
+        keys = []
+        for name in ordering[:-1]:
+            try:
+                field = queryset.model._meta.get_field(name.lstrip("-"))
+            except (AttributeError, FieldDoesNotExist):
+                raise serializers.ValidationError(
+                    {"cursor": "Эта сортировка не поддерживает курсор."}
+                )
+            keys.append((field, name.startswith("-")))
+        return keys
+
+    def get_seek_filter(self, cursor):
+        values = cursor.split(":")
+        if len(values) != len(self.keys) + 1 or not values[-1].isnumeric():
+            raise NotFound(self.invalid_cursor_message)
+        seek = Q(id__lt=int(values[-1]))
+        for (field, descending), value in reversed(
+            list(zip(self.keys, values))
+        ):
+            try:
+                value = field.to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = "lt" if descending else "gt"
+            seek = Q(**{f"{field.name}__{lookup}": value}) | (
+                Q(**{field.name: value}) & seek
+            )
+        return seek
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_cursor_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        last = self.page[-1]
+        cursor = ":".join(
+            [str(getattr(last, field.attname)) for field, _ in self.keys]
+            + [str(last.id)]
+        )
+        return replace_query_param(url, self.cursor_query_param, cursor)
@@ -0,0 +1,86 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone as django_timezone
+
+from recipes.models import Favorite, Recipe
+
+ORDERING_POPULAR = "popular"
+ORDERING_RECENT = "recent"
+ORDERING_QUICK = "quick"
+
+ORDERING_CHOICES = (
+    (ORDERING_POPULAR, "Популярные"),
+    (ORDERING_RECENT, "Новые"),
+    (ORDERING_QUICK, "Быстрые"),
+)
+
+ORDERINGS = {
+    # Unranked recipes score 0, below any stored score.
+    ORDERING_POPULAR: ("-rank_score", "-id"),
+    ORDERING_RECENT: ("-id",),
+    ORDERING_QUICK: ("cooking_time", "-id"),
+}
+
+# Scores are measured in half-lives since a fixed epoch, so a recipe
+# without new favorites keeps its stored score between refreshes.
+SCORE_EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def order_recipes(queryset, ordering):
+    return queryset.order_by(*ORDERINGS[ordering])
+
+
+def get_favorite_weight(created, half_life):
+    return (created - SCORE_EPOCH).total_seconds() / half_life
+
+
+def get_score(weights):
+    # log2 of the sum of 2 ** weight, shifted to avoid float overflow.
+    top = max(weights)
+    return top + math.log2(sum(2 ** (weight - top) for weight in weights))
+
+
+def compute_scores(now=None):
+    now = now or django_timezone.now()
+    since = now - timedelta(days=settings.RECIPE_RANK_WINDOW_DAYS)
+    half_life = timedelta(
+        days=settings.RECIPE_RANK_HALF_LIFE_DAYS
+    ).total_seconds()
+
+    weights = defaultdict(list)
+    favorites = (
+        Favorite.objects.filter(created__gte=since)
+        .order_by("created", "id")
+        .values_list("recipe_id", "created")
+    )
+    for recipe_id, created in favorites.iterator():
+        weights[recipe_id].append(get_favorite_weight(created, half_life))
+    return {
+        recipe_id: round(get_score(recipe_weights), 9)
+        for recipe_id, recipe_weights in weights.items()
+    }
+
+
+def refresh_recipe_ranks(now=None, batch_size=None):
+    scores = compute_scores(now)
+    stale = dict(
+        Recipe.objects.exclude(rank_score=0).values_list("id", "rank_score")
+    )
+
+    created, updated = 0, []
+    for recipe_id, score in scores.items():
+        previous = stale.pop(recipe_id, None)
+        if previous != score:
+            created += previous is None
+            updated.append(Recipe(id=recipe_id, rank_score=score))
+
+    with transaction.atomic():
+        Recipe.objects.bulk_update(
+            updated, ["rank_score"], batch_size=batch_size
+        )
+        Recipe.objects.filter(id__in=list(stale)).update(rank_score=0)
+    return created, len(updated) - created, len(stale)
@@ -0,0 +1,70 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from recipes.models import Favorite, Recipe, RecipeNeighbour
+
+
+def get_co_favorites(recipe_ids):
+    # Self-join of favorites through the user: how many users favorited
+    # both a recipe of the chunk and every other recipe.
+    return (
+        Favorite.objects.filter(recipe__in=recipe_ids)
+        .values(
+            "recipe_id",
+            "recipe__favorites_count",
+            other=F("user__favorite__recipe"),
+            other_count=F("user__favorite__recipe__favorites_count"),
+        )
+        .exclude(other=F("recipe"))
+        .annotate(count=Count("pk"))
+        .order_by()
+    )
+
+
+def get_neighbours(recipe_ids, top_k):
+    scores = defaultdict(list)
+    for row in get_co_favorites(recipe_ids).iterator():
+        norm = math.sqrt(row["recipe__favorites_count"] * row["other_count"])
+        if norm:
+            scores[row["recipe_id"]].append(
+                (min(row["count"] / norm, 1.0), row["other"])
+            )
+    return [
+        RecipeNeighbour(recipe_id=recipe_id, neighbour_id=other, score=score)
+        for recipe_id, candidates in scores.items()
+        for score, other in heapq.nlargest(top_k, candidates)
+    ]
+
+
+def build_neighbours(top_k=20, chunk_size=500):
+    recipes = (
+        Recipe.objects.filter(favorites_count__gt=0)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    last_id, built = 0, 0
+    while True:
+        chunk = list(recipes.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        neighbours = get_neighbours(chunk, top_k)
+        with transaction.atomic():
+            RecipeNeighbour.objects.filter(recipe__in=chunk).delete()
+            RecipeNeighbour.objects.bulk_create(neighbours)
+        last_id, built = chunk[-1], built + len(neighbours)
+    RecipeNeighbour.objects.filter(recipe__favorites_count=0).delete()
+    return built
+
+
+def recommend_recipes(queryset, user):
+    return (
+        queryset.filter(
+            neighbour_of__recipe__favorite__user=user, is_favorited=False
+        )
+        .annotate(recommendation=Sum("neighbour_of__score"))
+        .order_by("-recommendation", "-id")
+    )
@@ -0,0 +1,70 @@
+import csv
+
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.pdfgen import canvas
+
+FONT_NAME = "DejaVuSerif"
+FONT_FILE = "DejaVuSerif.ttf"
+
+PAGE_TOP = 800
+PAGE_BOTTOM = 50
+LINE_HEIGHT = 25
+
+
+def register_fonts():
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return
+    try:
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_FILE, "UTF-8"))
+    except TTFError as error:
+        raise ImproperlyConfigured(
+            f"Не удалось загрузить шрифт {FONT_FILE}: {error}"
+        )
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def format_line(number, item):
+    return (
+        f'{number}) {item["name"]} - {item["total"]} '
+        f'({item["measurement_unit"]}.)'
+    )
+
+
+def render_txt(ingredients):
+    yield "Список ингредиентов:\n"
+    for i, item in enumerate(ingredients, start=1):
+        yield format_line(i, item) + "\n"
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(["name", "measurement_unit", "amount"])
+    for item in ingredients:
+        yield writer.writerow(
+            [item["name"], item["measurement_unit"], item["total"]]
+        )
+
+
+def render_pdf(ingredients, output):
+    page = canvas.Canvas(output)
+    page.setFont(FONT_NAME, size=20)
+    page.drawString(180, 750, "Список ингредиентов:")
+    page.setFont(FONT_NAME, size=16)
+    height = 700
+
+    for i, item in enumerate(ingredients, start=1):
+        if height < PAGE_BOTTOM:
+            page.showPage()
+            page.setFont(FONT_NAME, size=16)
+            height = PAGE_TOP
+        page.drawString(50, height, format_line(i, item))
+        height -= LINE_HEIGHT
+
+    page.showPage()
+    page.save()
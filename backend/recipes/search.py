@@ -0,0 +1,132 @@
+import re
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connections
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, IngredientItem, Recipe
+
+CONFIG = "russian"
+FTS_TABLE = "recipes_recipe_fts"
+
+
+def is_postgres(using):
+    return connections[using].vendor == "postgresql"
+
+
+def update_search_index(recipe_ids, using="default"):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if is_postgres(using):
+        update_search_vector(recipe_ids, using)
+    else:
+        update_fts(recipe_ids, using)
+
+
+def update_search_vector(recipe_ids, using):
+    ingredients = Subquery(
+        IngredientItem.objects.filter(recipe=OuterRef("pk"))
+        .order_by()
+        .values("recipe")
+        .annotate(names=StringAgg("ingredient__name", " "))
+        .values("names")
+    )
+    Recipe.objects.using(using).filter(pk__in=recipe_ids).update(
+        search_vector=SearchVector("name", weight="A", config=CONFIG)
+        + SearchVector(
+            Coalesce(ingredients, Value("")), weight="B", config=CONFIG
+        )
+        + SearchVector("text", weight="C", config=CONFIG)
+    )
+
+
+def update_fts(recipe_ids, using):
+    placeholders = ", ".join(["%s"] * len(recipe_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+            recipe_ids,
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) "
+            "SELECT recipe.id, recipe.name, "
+            "COALESCE(GROUP_CONCAT(ingredient.name, ' '), ''), recipe.text "
+            "FROM recipes_recipe recipe "
+            "LEFT JOIN recipes_ingredientitem item "
+            "ON item.recipe_id = recipe.id "
+            "LEFT JOIN recipes_ingredient ingredient "
+            "ON ingredient.id = item.ingredient_id "
+            f"WHERE recipe.id IN ({placeholders}) "
+            "GROUP BY recipe.id",
+            recipe_ids,
+        )
+
+
+def search_recipes(queryset, text):
+    if is_postgres(queryset.db):
+        query = SearchQuery(text, config=CONFIG, search_type="websearch")
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F("search_vector"), query)
+        )
+    else:
+        terms = re.findall(r"\w+", text)
+        if not terms:
+            return queryset.none()
+        # every word must match, as a prefix since FTS5 does not stem
+        match = " ".join(f'"{term}"*' for term in terms)
+        queryset = queryset.filter(
+            id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                [match],
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s "
+                f"AND {FTS_TABLE}.rowid = recipes_recipe.id",
+                [match],
+            )
+        )
+    return queryset.order_by("-search_rank", "-id")
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, using, **kwargs):
+    update_search_index([instance.pk], using)
+
+
+# Bulk writes and deletes of items reindex their recipe explicitly.
+@receiver(post_save, sender=IngredientItem)
+def index_item_recipe(sender, instance, using, **kwargs):
+    update_search_index([instance.recipe_id], using)
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(sender, instance, created, using, **kwargs):
+    if not created:
+        update_search_index(
+            IngredientItem.objects.using(using)
+            .filter(ingredient=instance)
+            .values_list("recipe_id", flat=True)
+            .distinct(),
+            using,
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, using, **kwargs):
+    if not is_postgres(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [instance.pk]
+            )
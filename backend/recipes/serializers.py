@@ -1,8 +1,12 @@
+from collections import Counter
+
+from django.conf import settings
 from django.db import transaction
-from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from recipes.coverage import mark_recipes_changed
+from recipes.images import get_image_url, image_pipeline
 from recipes.models import (
     Cart,
     Favorite,
@@ -11,6 +15,9 @@ from recipes.models import (
     Recipe,
     RecipeTag,
 )
+from recipes.search import update_search_index
+from recipes.similarity import similar_index
+from recipes.thumbnails import VARIANT_CARD, VARIANT_FULL, VARIANT_THUMBNAIL
 from users.serializers import UserSerializer
 
 
@@ -21,10 +28,17 @@ class RecipeTagSerialzier(serializers.ModelSerializer):
 
 
 class RecipeSubscriptionSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = ["id", "name", "image", "cooking_time"]
 
+    def get_image(self, obj):
+        return get_image_url(
+            obj, VARIANT_THUMBNAIL, self.context.get("request")
+        )
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,6 +47,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source="ingredient_id")
     name = serializers.ReadOnlyField(source="ingredient.name")
     measurement_unit = serializers.ReadOnlyField(
         source="ingredient.measurement_unit"
@@ -47,34 +62,25 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = serializers.SerializerMethodField()
     tags = RecipeTagSerialzier(many=True)
     author = UserSerializer()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    image = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = "__all__"
 
     def get_ingredients(self, obj):
-        qset = IngredientItem.objects.filter(recipe=obj)
+        qset = obj.recipe_ingredients.all()
         return IngredientItemSerializer(qset, many=True).data
 
-    def get_is_favorited(self, obj):
-        try:
-            request = self.context.get("request")
-            is_favorited = Favorite.objects.filter(
-                user=request.user, recipe=obj
-            )
-            return is_favorited.exists()
-        except TypeError:
-            return False
-
-    def get_is_in_shopping_cart(self, obj):
-        try:
-            request = self.context.get("request")
-            is_in_cart = Cart.objects.filter(user=request.user, recipe=obj)
-            return is_in_cart.exists()
-        except TypeError:
-            return False
+    def get_image(self, obj):
+        view = self.context.get("view")
+        if view is not None and view.action == "retrieve":
+            variant = VARIANT_FULL
+        else:
+            variant = VARIANT_CARD
+        return get_image_url(obj, variant, self.context.get("request"))
 
 
 class IngredientItemPost(serializers.Serializer):
@@ -104,45 +110,43 @@ class RecipeSerializerPost(serializers.ModelSerializer):
         ]
 
     def validate(self, data):
-        unique_ingr = data["ingredients"]
-        ingr_list = []
-        for item in unique_ingr:
-            id = item["id"]
-            amount = item["amount"]
-            try:
-                exist_item = get_object_or_404(
-                    IngredientItem, id=id, amount=amount
+        submitted = data["ingredients"]
+        ingredient_ids = [item["id"] for item in submitted]
+        ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+
+        errors = {}
+        duplicates = [
+            ingredient_id
+            for ingredient_id, count in Counter(ingredient_ids).items()
+            if count > 1
+        ]
+        if duplicates:
+            errors["duplicates"] = sorted(duplicates)
+        missing = set(ingredient_ids) - set(ingredients)
+        if missing:
+            errors["missing"] = sorted(missing)
+        if errors:
+            messages = []
+            if duplicates:
+                messages.append(
+                    "Извините, но добавить одинаковые ингредиенты нельзя."
                 )
-                if exist_item.ingredient in ingr_list:
-                    raise serializers.ValidationError(
-                        {
-                            "message": "Извините,"
-                            " но добавить одинаковые ингредиенты нельзя."
-                        }
-                    )
-                else:
-                    ingr_list.append(exist_item.ingredient)
-            except Exception:
-                new_ingr = get_object_or_404(Ingredient, id=id)
-                if new_ingr in ingr_list:
-                    raise serializers.ValidationError(
-                        {
-                            "message": "Извините,"
-                            " но добавить одинаковые ингредиенты нельзя."
-                        }
-                    )
-                else:
-                    ingr_list.append(new_ingr)
-
-        if len(ingr_list) != len(set(ingr_list)):
+            if missing:
+                messages.append("Извините, но таких ингредиентов нет.")
             raise serializers.ValidationError(
-                {
-                    "message": "Извините,"
-                    " но добавить одинаковые ингредиенты нельзя."
-                }
+                {"message": " ".join(messages), **errors}
             )
+
+        data["ingredients"] = [
+            {
+                "ingredient": ingredients[ingredient_id],
+                "amount": item["amount"],
+            }
+            for ingredient_id, item in zip(ingredient_ids, submitted)
+        ]
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         image = validated_data.pop("image")
         tags = validated_data.pop("tags")
@@ -159,60 +163,68 @@ class RecipeSerializerPost(serializers.ModelSerializer):
         items = [
             IngredientItem(
                 recipe=recipe,
-                ingredient=get_object_or_404(Ingredient, id=item["id"]),
+                ingredient=item["ingredient"],
                 amount=item["amount"],
             )
             for item in ingredients
         ]
 
         IngredientItem.objects.bulk_create(items)
+        update_search_index([recipe.id])
+        # bulk_create does not send post_save for the coverage index
+        mark_recipes_changed([recipe.id])
+        transaction.on_commit(lambda: similar_index.update_recipe(recipe.id))
+        transaction.on_commit(lambda: image_pipeline.schedule(recipe.id))
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
-        try:
-            image = validated_data.pop("image")
-            instance.image = image
-            instance.save()
-        except KeyError:
-            pass
-
-        recipe = Recipe.objects.filter(id=instance.id)
-        recipe.update(**validated_data)
-
-        instance_tags = [tag for tag in instance.tags.all()]
-
-        for tag in tags:
-            if tag in instance_tags:
-                instance_tags.remove(tag)
-            else:
-                instance.tags.add(tag)
-        instance.tags.remove(*instance_tags)
-
-        instance_ingredients = [
-            ingredient for ingredient in instance.ingredients.all()
-        ]
+        new_image = "image" in validated_data
+        update_fields = list(validated_data)
+        if new_image:
+            instance.image_variants = {}
+            update_fields.append("image_variants")
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        # Counters and rank_score are changed concurrently with F().
+        instance.save(update_fields=update_fields)
+        instance.tags.set(tags)
+
+        current = {
+            item.ingredient_id: item
+            for item in instance.recipe_ingredients.all()
+        }
+        created, changed = [], []
         for item in ingredients:
-            amount = item["amount"]
-            id = item["id"]
-            try:
-                exist_item_ingredient = IngredientItem.objects.get(
-                    id=id, amount=amount
-                )
-
-                instance_ingredients.remove(exist_item_ingredient.ingredient)
-            except IngredientItem.DoesNotExist:
-                IngredientItem.objects.create(
-                    recipe=instance,
-                    ingredient=get_object_or_404(Ingredient, id=id),
-                    amount=amount,
+            exist_item = current.pop(item["ingredient"].id, None)
+            if exist_item is None:
+                created.append(
+                    IngredientItem(
+                        recipe=instance,
+                        ingredient=item["ingredient"],
+                        amount=item["amount"],
+                    )
                 )
-
-        instance.ingredients.remove(*instance_ingredients)
-
+            elif exist_item.amount != item["amount"]:
+                exist_item.amount = item["amount"]
+                changed.append(exist_item)
+        IngredientItem.objects.filter(
+            id__in=[item.id for item in current.values()]
+        ).delete()
+        IngredientItem.objects.bulk_create(created)
+        IngredientItem.objects.bulk_update(changed, ["amount"])
+
+        update_search_index([instance.id])
+        mark_recipes_changed([instance.id])
+        transaction.on_commit(
+            lambda: similar_index.update_recipe(instance.id)
+        )
+        if new_image:
+            transaction.on_commit(
+                lambda: image_pipeline.schedule(instance.id)
+            )
         return instance
 
 
@@ -249,3 +261,31 @@ class CartSerializer(serializers.ModelSerializer):
                 {"message": "Извините, но рецепт уже добвлен в корзину."}
             )
         return validated_data
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Recipe
+        fields = ["image"]
+
+    def validate_image(self, image):
+        # Only the header has been read so far, the pixels are not decoded.
+        width, height = image.image.size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                "Разрешение изображения слишком большое."
+            )
+        return image
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        instance.image = validated_data["image"]
+        instance.image_variants = {}
+        instance.save(update_fields=["image", "image_variants"])
+        transaction.on_commit(lambda: image_pipeline.schedule(instance.id))
+        return instance
+
+    def to_representation(self, instance):
+        return RecipeSubscriptionSerializer(
+            instance, context=self.context
+        ).data
@@ -0,0 +1,29 @@
+import hashlib
+import json
+
+from django.db.models import F, Sum
+
+from recipes.models import IngredientItem
+
+
+def get_shopping_list(user):
+    return (
+        IngredientItem.objects.filter(recipe__cart__user=user)
+        .values(
+            name=F("ingredient__name"),
+            measurement_unit=F("ingredient__measurement_unit"),
+        )
+        .annotate(total=Sum("amount"))
+        .order_by("name")
+    )
+
+
+def get_shopping_list_hash(ingredients):
+    content = json.dumps(
+        [
+            [item["name"], item["measurement_unit"], item["total"]]
+            for item in ingredients
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
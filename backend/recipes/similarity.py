@@ -0,0 +1,222 @@
+import os
+import random
+import struct
+import uuid
+from collections import defaultdict
+from mmap import ACCESS_READ, mmap
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from recipes.models import IngredientItem, Recipe
+from recipes.versioning import VersionedIndex
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# Fixed size records: recipe id followed by its MinHash signature.
+# Later records override earlier ones, a signature of MAX_HASH only
+# marks a removed recipe.
+RECORD = struct.Struct(f"<q{NUM_HASHES}I")
+TOMBSTONE = (MAX_HASH,) * NUM_HASHES
+
+_random = random.Random(2021)
+HASH_PARAMS = [
+    (_random.randrange(1, PRIME), _random.randrange(PRIME))
+    for _ in range(NUM_HASHES)
+]
+
+
+def get_signature(ingredient_ids):
+    if not ingredient_ids:
+        return TOMBSTONE
+    return tuple(
+        min(((a * x + b) % PRIME) & MAX_HASH for x in ingredient_ids)
+        for a, b in HASH_PARAMS
+    )
+
+
+def get_band_keys(signature):
+    keys = []
+    for band in range(BANDS):
+        start = band * ROWS
+        end = start + ROWS
+        keys.append((band, hash(signature[start:end])))
+    return keys
+
+
+def get_similarity(first, second):
+    return sum(x == y for x, y in zip(first, second)) / NUM_HASHES
+
+
+class SimilarRecipesIndex(VersionedIndex):
+    def __init__(self):
+        super().__init__()
+        self.data = None
+        self.inode = None
+        self.offset = 0
+        self.positions = {}
+        self.buckets = defaultdict(set)
+
+    @property
+    def path(self):
+        return settings.SIMILAR_RECIPES_INDEX
+
+    def get_ttl(self):
+        # A stat call is cheap enough to make on every request.
+        return 0
+
+    def get_version(self):
+        # The file is shared by every process: appends change its size
+        # and a rebuild replaces it with a new inode.
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return (self.path,)
+        return (self.path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def reset(self):
+        self.inode = None
+        self.offset = 0
+        self.positions = {}
+        self.buckets = defaultdict(set)
+
+    def reload(self):
+        try:
+            with open(self.path, "rb") as index_file:
+                data = self.load(index_file)
+        except FileNotFoundError:
+            self.reset()
+            data = None
+        previous, self.data = self.data, data
+        if previous is not None:
+            previous.close()
+
+    def load(self, index_file):
+        # Appends only add records at the end, so the records already
+        # applied are kept unless the file was replaced by a rebuild.
+        stat = os.fstat(index_file.fileno())
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.reset()
+        if not stat.st_size:
+            return None
+        data = mmap(index_file.fileno(), 0, access=ACCESS_READ)
+        # A record still being written is read on the next load.
+        end = len(data) // RECORD.size * RECORD.size
+        for slot in range(self.offset // RECORD.size, end // RECORD.size):
+            self.apply(data, slot)
+        self.inode, self.offset = stat.st_ino, end
+        return data
+
+    def apply(self, data, slot):
+        recipe_id = RECORD.unpack_from(data, slot * RECORD.size)[0]
+        signature = self.get_record(data, slot)
+        previous = self.positions.pop(recipe_id, None)
+        if previous is not None:
+            for key in get_band_keys(self.get_record(data, previous)):
+                bucket = self.buckets[key]
+                bucket.discard(recipe_id)
+                if not bucket:
+                    del self.buckets[key]
+        if signature == TOMBSTONE:
+            return
+        self.positions[recipe_id] = slot
+        for key in get_band_keys(signature):
+            self.buckets[key].add(recipe_id)
+
+    def get_record(self, data, slot):
+        return RECORD.unpack_from(data, slot * RECORD.size)[1:]
+
+    def similar(self, recipe_id, limit=None):
+        self.refresh()
+        # The buckets are updated in place on reload.
+        with self.lock:
+            data, positions = self.data, self.positions
+            if recipe_id not in positions:
+                return []
+            signature = self.get_record(data, positions[recipe_id])
+            candidates = {
+                candidate
+                for key in get_band_keys(signature)
+                for candidate in self.buckets.get(key, ())
+            }
+            candidates.discard(recipe_id)
+            result = sorted(
+                (
+                    (
+                        candidate,
+                        get_similarity(
+                            signature,
+                            self.get_record(data, positions[candidate]),
+                        ),
+                    )
+                    for candidate in candidates
+                ),
+                key=lambda item: (-item[1], -item[0]),
+            )
+        return result[:limit]
+
+    def append(self, recipe_ingredients):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        content = b"".join(
+            RECORD.pack(recipe_id, *get_signature(ingredient_ids))
+            for recipe_id, ingredient_ids in recipe_ingredients
+        )
+        descriptor = os.open(
+            self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        try:
+            os.write(descriptor, content)
+        finally:
+            os.close(descriptor)
+
+    def update_recipe(self, recipe_id):
+        ingredient_ids = IngredientItem.objects.filter(
+            recipe=recipe_id
+        ).values_list("ingredient_id", flat=True)
+        self.append([(recipe_id, list(ingredient_ids))])
+
+    def remove_recipe(self, recipe_id):
+        self.append([(recipe_id, [])])
+
+    def rebuild(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        items = (
+            IngredientItem.objects.order_by("recipe_id")
+            .values_list("recipe_id", "ingredient_id")
+            .iterator()
+        )
+        temporary = f"{self.path}.{uuid.uuid4().hex}"
+        count = 0
+        with open(temporary, "wb") as index_file:
+            recipe_id, ingredient_ids = None, []
+            for item_recipe_id, ingredient_id in items:
+                if item_recipe_id != recipe_id and ingredient_ids:
+                    index_file.write(
+                        RECORD.pack(recipe_id, *get_signature(ingredient_ids))
+                    )
+                    count += 1
+                    ingredient_ids = []
+                recipe_id = item_recipe_id
+                ingredient_ids.append(ingredient_id)
+            if ingredient_ids:
+                index_file.write(
+                    RECORD.pack(recipe_id, *get_signature(ingredient_ids))
+                )
+                count += 1
+        os.replace(temporary, self.path)
+        return count
+
+
+similar_index = SimilarRecipesIndex()
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_similar_recipe(sender, instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(lambda: similar_index.remove_recipe(recipe_id))
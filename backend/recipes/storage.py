@@ -0,0 +1,51 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+
+def lock_blob(name):
+    # The row lock serializes reusing a blob with deleting it, it is held
+    # until the caller's transaction commits the recipe that uses it.
+    from recipes.models import ImageBlob
+
+    while True:
+        ImageBlob.objects.bulk_create(
+            [ImageBlob(name=name)], ignore_conflicts=True
+        )
+        if ImageBlob.objects.select_for_update().filter(name=name):
+            return
+
+
+class HashedStorage(FileSystemStorage):
+    # Files are named by the SHA-256 of their content, so a name always
+    # refers to the same bytes and identical uploads share one file.
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        with transaction.atomic():
+            lock_blob(name)
+            if self.exists(name):
+                return name
+            return self._save(name, content)
+
+    def get_hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name),
+            digest[:2],
+            digest[2:4],
+            digest + extension,
+        )
+
+
+recipe_image_storage = HashedStorage()
@@ -0,0 +1,153 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from recipes.models import Ingredient, Recipe
+from users.models import Profile
+from users.tests.factories import UserFactory
+
+from .factories import (
+    FavoriteFactory,
+    IngredientFactory,
+    RecipeFactory,
+    RecipeTagFactory,
+)
+
+
+class LoadIngredientsTests(TestCase):
+    def test_load_ingredients_csv_and_json(self):
+
+        """Load ingredients in batches, skip existing, upsert units"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = Path(directory) / "ingredients.csv"
+            csv_path.write_text(
+                "мука,г\nсоль,по вкусу\nмолоко,мл\nмука,г\n", encoding="utf-8"
+            )
+            json_path = Path(directory) / "ingredients.json"
+            json_path.write_text(
+                json.dumps(
+                    [
+                        {"title": "молоко", "dimension": "стакан"},
+                        {"title": "яйца", "dimension": "шт."},
+                    ],
+                    ensure_ascii=False,
+                ),
+                encoding="utf-8",
+            )
+
+            out = StringIO()
+            # savepoint, two batched inserts, release
+            with self.assertNumQueries(4):
+                call_command(
+                    "load_ingredients", str(csv_path), batch_size=2, stdout=out
+                )
+            self.assertIn("rows/s", out.getvalue())
+            self.assertEqual(Ingredient.objects.count(), 3)
+
+            call_command("load_ingredients", str(json_path), stdout=out)
+            self.assertEqual(
+                Ingredient.objects.get(name="молоко").measurement_unit, "мл"
+            )
+            self.assertEqual(Ingredient.objects.count(), 4)
+
+            call_command(
+                "load_ingredients", str(json_path), update=True, stdout=out
+            )
+            self.assertEqual(
+                Ingredient.objects.get(name="молоко").measurement_unit,
+                "стакан",
+            )
+            self.assertEqual(Ingredient.objects.count(), 4)
+
+
+class RecountTests(TestCase):
+    def test_recount(self):
+
+        """Recount restores drifted counters and missing profiles"""
+
+        UserFactory.create_batch(3)
+        IngredientFactory.create_batch(10)
+        RecipeTagFactory.create_batch(2)
+        RecipeFactory.create_batch(3)
+        FavoriteFactory.create_batch(3)
+        expected = {
+            recipe.id: recipe.favorites_count
+            for recipe in Recipe.objects.all()
+        }
+        Recipe.objects.update(favorites_count=100)
+        lost = UserFactory()
+        Profile.objects.filter(user=lost).delete()
+
+        out = StringIO()
+        call_command("recount", stdout=out)
+        self.assertIn("Recounted", out.getvalue())
+        self.assertEqual(
+            dict(Recipe.objects.values_list("id", "favorites_count")),
+            expected,
+        )
+        self.assertEqual(sum(expected.values()), 3)
+        self.assertTrue(Profile.objects.filter(user=lost).exists())
+
+
+class BenchCoverageTests(TestCase):
+    def test_bench_coverage(self):
+
+        """Benchmark compares the bitmap index with a full scan"""
+
+        out = StringIO()
+        call_command(
+            "bench_coverage",
+            recipes=500,
+            ingredients=50,
+            queries=5,
+            stdout=out,
+        )
+        self.assertIn("speedup", out.getvalue())
+
+
+class BenchRenderersTests(TestCase):
+    def test_bench_renderers(self):
+
+        """Benchmark compares per-request font loading with startup"""
+
+        out = StringIO()
+        call_command(
+            "bench_renderers", lines=5, iterations=2, repeat=1, stdout=out
+        )
+        self.assertIn("registered once", out.getvalue())
+        self.assertIn("speedup", out.getvalue())
+
+
+class DedupeImagesTests(TestCase):
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_dedupe_images(self):
+
+        """Copies of one photo collapse into a single hashed file"""
+
+        author = UserFactory()
+        IngredientFactory.create_batch(10)
+        RecipeTagFactory.create_batch(2)
+        recipes = RecipeFactory.create_batch(3, author=author)
+        legacy = FileSystemStorage()
+        for recipe in recipes:
+            name = legacy.save("recipes/photo.jpg", ContentFile(b"photo"))
+            Recipe.objects.filter(id=recipe.id).update(image=name)
+        legacy_names = set(Recipe.objects.values_list("image", flat=True))
+        self.assertEqual(len(legacy_names), 3)
+
+        out = StringIO()
+        call_command("dedupe_images", stdout=out)
+        self.assertIn("Moved 3 of 3", out.getvalue())
+        names = set(Recipe.objects.values_list("image", flat=True))
+        self.assertEqual(len(names), 1)
+        with legacy.open(names.pop()) as image:
+            self.assertEqual(image.read(), b"photo")
+        for name in legacy_names:
+            self.assertFalse(legacy.exists(name))
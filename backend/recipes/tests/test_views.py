@@ -1,19 +1,43 @@
+import hashlib
+import os
+import re
 import tempfile
-
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
+from recipes.coverage import coverage_index
 from recipes.models import (
     Cart,
+    CoverageChange,
     Favorite,
+    ImageBlob,
     Ingredient,
     IngredientItem,
     Recipe,
+    RecipeNeighbour,
     RecipeTag,
 )
-from users.tests.factories import UserFactory
+from recipes.ranking import ORDERING_POPULAR, ORDERING_QUICK, order_recipes
+from recipes.search import update_search_index
+from recipes.serializers import RecipeImageSerializer, RecipeSerializerPost
+from recipes.shopping_list import get_shopping_list
+from recipes.similarity import similar_index
+from recipes.thumbnails import VARIANTS
+from users.models import Subscription
+from users.tests.factories import SubscriptionFactory, UserFactory
 
 from .factories import IngredientFactory, RecipeFactory, RecipeTagFactory
 
@@ -453,8 +477,8 @@ class ViewRecipeTests(APITestCase):
             "name": "test_upd",
             "tags": [tag[1].id],
             "ingredients": [
-                {"id": item[0].id, "amount": 65},
-                {"id": item[1].id, "amount": 100},
+                {"id": item[0].ingredient_id, "amount": 65},
+                {"id": item[1].ingredient_id, "amount": 100},
                 {"id": 1, "amount": 150},
             ],
             "cooking_time": 77,
@@ -586,3 +610,976 @@ class ViewRecipeTests(APITestCase):
         self.assertEqual(
             Favorite.objects.filter(user=user).count(), count_favorite
         )
+
+    def test_recipes_list_user_flags_queries(self):
+
+        """Favorite and cart flags are computed in the main query"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        for recipe in Recipe.objects.all():
+            Favorite.objects.create(user=user, recipe=recipe)
+            Cart.objects.create(user=user, recipe=recipe)
+
+        def flag_queries(limit):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(self.path_recipes + f"?limit={limit}")
+            return response, [
+                query
+                for query in queries.captured_queries
+                if "recipes_favorite" in query["sql"]
+                or "recipes_cart" in query["sql"]
+            ]
+
+        _, small_page_queries = flag_queries(1)
+        response, large_page_queries = flag_queries(5)
+
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertEqual(len(large_page_queries), len(small_page_queries))
+        for recipe in response.data["results"]:
+            with self.subTest(recipe=recipe["id"]):
+                self.assertTrue(recipe["is_favorited"])
+                self.assertTrue(recipe["is_in_shopping_cart"])
+
+        response = client.get(self.path_recipes + "?is_favorited=false")
+        self.assertEqual(response.data["count"], 0)
+        response = ViewRecipeTests.unauthorized_client.get(
+            self.path_recipes + "?is_in_shopping_cart=true"
+        )
+        self.assertEqual(response.data["count"], 0)
+
+    def test_recipes_list_constant_queries(self):
+
+        """List and detail take a fixed number of queries"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        for recipe in Recipe.objects.all():
+            Favorite.objects.create(user=user, recipe=recipe)
+
+        # count, recipes, authors, tags, ingredients
+        for limit in (1, 5):
+            with self.subTest(limit=limit), self.assertNumQueries(5):
+                client.get(self.path_recipes + f"?limit={limit}")
+            with self.subTest(limit=limit), self.assertNumQueries(5):
+                ViewRecipeTests.unauthorized_client.get(
+                    self.path_recipes + f"?limit={limit}"
+                )
+
+        recipe = Recipe.objects.first()
+        with self.assertNumQueries(4):
+            response = client.get(self.path_recipes + f"{recipe.id}/")
+        self.assertFalse(response.data["author"]["is_subscribed"])
+        self.assertEqual(
+            len(response.data["ingredients"]),
+            recipe.recipe_ingredients.count(),
+        )
+
+        Subscription.objects.create(subscriber=user, author=recipe.author)
+        response = client.get(self.path_recipes + f"{recipe.id}/")
+        self.assertTrue(response.data["author"]["is_subscribed"])
+
+    def test_recipes_list_cursor_pagination(self):
+
+        """Walk the recipe list with keyset pagination"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        recipes = list(Recipe.objects.order_by("-id"))
+        for recipe in recipes[::2]:
+            Favorite.objects.create(user=user, recipe=recipe)
+        tag = recipes[0].tags.first()
+
+        for query, expected in (
+            ("", recipes),
+            ("is_favorited=true&", recipes[::2]),
+            ("is_favorited=false&", recipes[1::2]),
+            (
+                f"author={recipes[0].author.id}&",
+                recipes[0].author.recipe_set.order_by("-id"),
+            ),
+            (
+                f"tags={tag.slug}&",
+                Recipe.objects.filter(tags=tag).order_by("-id"),
+            ),
+        ):
+            with self.subTest(query=query):
+                seen = []
+                url = self.path_recipes + f"?{query}limit=2&cursor="
+                while url:
+                    response_data = client.get(url).data
+                    self.assertFalse("count" in response_data)
+                    self.assertTrue(len(response_data["results"]) <= 2)
+                    seen += [item["id"] for item in response_data["results"]]
+                    url = response_data["next"]
+                self.assertEqual(seen, [recipe.id for recipe in expected])
+
+        response = client.get(self.path_recipes + "?cursor=abc")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_recipes_ordering_cursor_pagination(self):
+
+        """Keyset pagination follows the requested ordering"""
+
+        client = ViewRecipeTests.unauthorized_client
+        author = UserFactory()
+        for time, score in ((5, 0), (5, 2.5), (10, 0), (10, 7.25), (5, 2.5)):
+            recipe = RecipeFactory(author=author, cooking_time=time)
+            Recipe.objects.filter(id=recipe.id).update(rank_score=score)
+        recipes = Recipe.objects.filter(author=author)
+
+        for path, ordering in (
+            (f"?author={author.id}&ordering=quick&", ORDERING_QUICK),
+            (f"?author={author.id}&ordering=popular&", ORDERING_POPULAR),
+            (f"popular/?author={author.id}&", ORDERING_POPULAR),
+        ):
+            with self.subTest(path=path):
+                seen = []
+                url = self.path_recipes + f"{path}limit=2&cursor="
+                while url:
+                    response_data = client.get(url).data
+                    seen += [item["id"] for item in response_data["results"]]
+                    url = response_data["next"]
+                expected = order_recipes(recipes, ordering)
+                self.assertEqual(seen, [recipe.id for recipe in expected])
+
+        response = client.get(self.path_recipes + "?search=суп&cursor=")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.get(self.path_recipes + "?ordering=quick&cursor=5")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(PAGINATION_COUNT_STRATEGY="cached")
+    def test_recipes_list_cached_count(self):
+
+        """Count is cached per filter set"""
+
+        cache.clear()
+        client = ViewRecipeTests.unauthorized_client
+        recipe_count = Recipe.objects.count()
+
+        def count_queries(query):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(self.path_recipes + query)
+            return response.data["count"], [
+                item
+                for item in queries.captured_queries
+                if "COUNT(" in item["sql"]
+            ]
+
+        count, queries = count_queries("?page=1")
+        self.assertEqual(count, recipe_count)
+        self.assertEqual(len(queries), 1)
+
+        count, queries = count_queries("?page=2&limit=2")
+        self.assertEqual(count, recipe_count)
+        self.assertEqual(len(queries), 0)
+
+        author = Recipe.objects.first().author
+        count, queries = count_queries(f"?author={author.id}")
+        self.assertEqual(count, author.recipe_set.count())
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(PAGINATION_COUNT_STRATEGY="estimated")
+    def test_recipes_list_estimated_count(self):
+
+        """Estimated count falls back to exact without planner statistics"""
+
+        response = ViewRecipeTests.unauthorized_client.get(self.path_recipes)
+        self.assertEqual(response.data["count"], Recipe.objects.count())
+
+    def test_download_shopping_cart(self):
+
+        """Shopping list sums amounts per ingredient and breaks pages"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        first, second = RecipeFactory.create_batch(2, author=user)
+        shared = IngredientFactory(name="общий", measurement_unit="г")
+        IngredientItem.objects.create(
+            recipe=first, ingredient=shared, amount=10
+        )
+        IngredientItem.objects.create(
+            recipe=second, ingredient=shared, amount=15
+        )
+        for index in range(60):
+            IngredientItem.objects.create(
+                recipe=first,
+                ingredient=IngredientFactory(name=f"ингредиент {index}"),
+                amount=index + 1,
+            )
+        Cart.objects.create(user=user, recipe=first)
+        Cart.objects.create(user=user, recipe=second)
+
+        expected = {}
+        for item in IngredientItem.objects.filter(recipe__cart__user=user):
+            name = item.ingredient.name
+            expected[name] = expected.get(name, 0) + item.amount
+
+        with self.assertNumQueries(1):
+            shopping_list = list(get_shopping_list(user))
+        self.assertEqual(
+            {item["name"]: item["total"] for item in shopping_list}, expected
+        )
+        self.assertEqual(expected["общий"], 25)
+
+        response = client.get(self.path_recipes + "download_shopping_cart/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        pages = re.findall(rb"/Type /Page\b(?!s)", response.content)
+        self.assertTrue(len(pages) > 1)
+        self.assertFalse(Cart.objects.filter(user=user).exists())
+
+    @override_settings(SHOPPING_CART_CLEAR_ON_DOWNLOAD=False)
+    def test_download_shopping_cart_cached(self):
+
+        """Identical shopping lists are served from cache with ETag"""
+
+        cache.clear()
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        recipe = RecipeFactory(author=user)
+        IngredientItem.objects.create(
+            recipe=recipe, ingredient=IngredientFactory(name="Кардамон")
+        )
+        Cart.objects.create(user=user, recipe=recipe)
+        path = self.path_recipes + "download_shopping_cart/"
+
+        response = client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertTrue(Cart.objects.filter(user=user).exists())
+
+        with patch("recipes.views.render_pdf") as render_pdf:
+            cached_response = client.get(path)
+        render_pdf.assert_not_called()
+        self.assertEqual(cached_response["ETag"], etag)
+        self.assertEqual(cached_response.content, response.content)
+
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        IngredientItem.objects.filter(recipe=recipe).update(amount=999)
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_download_shopping_cart_text_formats(self):
+
+        """Shopping list is streamed as txt and csv"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        recipe = RecipeFactory(author=user)
+        path = self.path_recipes + "download_shopping_cart/"
+
+        for export_format in ("txt", "csv"):
+            with self.subTest(format=export_format):
+                Cart.objects.create(user=user, recipe=recipe)
+                shopping_list = list(get_shopping_list(user))
+                response = client.get(path + f"?format={export_format}")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertTrue(response.streaming)
+                content = b"".join(response.streaming_content).decode()
+                for item in shopping_list:
+                    self.assertIn(item["name"], content)
+                    self.assertIn(str(item["total"]), content)
+                self.assertFalse(Cart.objects.filter(user=user).exists())
+
+        response = client.get(path + "?format=csv")
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows, ["name,measurement_unit,amount"])
+
+        response = client.get(path + "?format=docx")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ingredients_prefix_search(self):
+
+        """Prefix search is answered from the in-process index"""
+
+        cache.clear()
+        client = ViewRecipeTests.unauthorized_client
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ("Яблоко", "Яблочный сок", "Ягоды"):
+                IngredientFactory(name=name)
+
+        response = client.get(self.path_ingredients + "?name=Ябл")
+        self.assertEqual(
+            [item["name"] for item in response.data],
+            ["Яблоко", "Яблочный сок"],
+        )
+        self.assertEqual(
+            list(response.data[0]), ["id", "name", "measurement_unit"]
+        )
+
+        # the shared index version is read at most once per TTL
+        with override_settings(INDEX_VERSION_TTL=60):
+            client.get(self.path_ingredients + "?name=Я")
+            with self.assertNumQueries(0):
+                response = client.get(
+                    self.path_ingredients + "?name=Я&limit=1"
+                )
+        self.assertEqual(len(response.data), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(name="Яблоко").delete()
+            IngredientFactory(name="Ябеда")
+        response = client.get(self.path_ingredients + "?name=Ябл")
+        self.assertEqual(
+            [item["name"] for item in response.data], ["Яблочный сок"]
+        )
+        response = client.get(self.path_ingredients + "?name=Ябе")
+        self.assertEqual([item["name"] for item in response.data], ["Ябеда"])
+
+    def test_recipe_counters(self):
+
+        """Favorite, cart and author recipe counters follow changes"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        recipe = RecipeFactory(author=user)
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.recipes_count, 1)
+
+        client.get(self.path_recipes + f"{recipe.id}/favorite/")
+        client.get(self.path_recipes + f"{recipe.id}/favorite/")
+        client.get(self.path_recipes + f"{recipe.id}/shopping_cart/")
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 1)
+
+        client.delete(self.path_recipes + f"{recipe.id}/favorite/")
+        client.delete(self.path_recipes + f"{recipe.id}/favorite/")
+        client.delete(self.path_recipes + f"{recipe.id}/shopping_cart/")
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(recipe.in_carts_count, 0)
+
+        client.delete(self.path_recipes + f"{recipe.id}/")
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.recipes_count, 0)
+
+    def test_recipes_ordering(self):
+
+        """Popular ordering reads the precomputed rank score"""
+
+        author = UserFactory()
+        old, fresh, quick, plain = [
+            RecipeFactory(author=author, cooking_time=time)
+            for time in (30, 20, 5, 10)
+        ]
+        now = timezone.now()
+        for recipe, days in ((old, 20), (old, 20), (old, 20), (fresh, 1)):
+            favorite = Favorite.objects.create(
+                user=UserFactory(), recipe=recipe
+            )
+            Favorite.objects.filter(pk=favorite.pk).update(
+                created=now - timedelta(days=days)
+            )
+        Favorite.objects.create(user=UserFactory(), recipe=quick)
+        Favorite.objects.filter(recipe=quick).update(
+            created=now - timedelta(days=40)
+        )
+
+        out = StringIO()
+        call_command("rank_recipes", stdout=out)
+        self.assertIn("updated: 0", out.getvalue())
+        call_command("rank_recipes", stdout=out)
+        self.assertIn("created: 0, updated: 0, removed: 0", out.getvalue())
+
+        def ids(query):
+            response = self.unauthorized_client.get(
+                self.path_recipes + f"?author={author.id}&{query}"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [recipe["id"] for recipe in response.data["results"]]
+
+        # three favorites from twenty days ago weigh less than a fresh one
+        self.assertEqual(
+            ids("ordering=popular"), [fresh.id, old.id, plain.id, quick.id]
+        )
+        self.assertEqual(
+            ids("ordering=recent"), [plain.id, quick.id, fresh.id, old.id]
+        )
+        self.assertEqual(
+            ids("ordering=quick"), [quick.id, plain.id, fresh.id, old.id]
+        )
+        response = self.unauthorized_client.get(
+            self.path_recipes + "?ordering=random"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.unauthorized_client.get(
+            self.path_recipes + f"popular/?author={author.id}"
+        )
+        self.assertEqual(response.data["results"][0]["id"], fresh.id)
+
+        # the top page of each ordering is read from its index
+        for ordering, index in (
+            (ORDERING_POPULAR, "recipe_popular_idx"),
+            (ORDERING_QUICK, "recipe_quick_idx"),
+        ):
+            with self.subTest(ordering=ordering):
+                queryset = order_recipes(Recipe.objects.all(), ordering)
+                self.assertIn(index, queryset[:10].explain())
+
+    @override_settings(MEDIA_ROOT=tempfile.gettempdir())
+    def test_recipes_similar(self):
+
+        """Similar recipes come from the MinHash index on disk"""
+
+        ingredients = [
+            IngredientFactory(name=f"Специя {i}") for i in range(30)
+        ]
+
+        def make_recipe(items):
+            recipe = RecipeFactory()
+            recipe.recipe_ingredients.all().delete()
+            IngredientItem.objects.bulk_create(
+                IngredientItem(recipe=recipe, ingredient=item)
+                for item in items
+            )
+            return recipe
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/similar.idx"
+            with override_settings(SIMILAR_RECIPES_INDEX=path):
+                base = make_recipe(ingredients[:10])
+                close = make_recipe(ingredients[:9] + ingredients[10:11])
+                other = make_recipe(ingredients[20:30])
+                out = StringIO()
+                call_command("build_similar_index", stdout=out)
+                self.assertIn("Indexed", out.getvalue())
+
+                def similar_ids(recipe):
+                    response = self.unauthorized_client.get(
+                        self.path_recipes + f"{recipe.id}/similar/"
+                    )
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    return [item["id"] for item in response.data]
+
+                self.assertEqual(similar_ids(base), [close.id])
+                self.assertEqual(similar_ids(other), [])
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = ViewRecipeTests.authorized_client.post(
+                        self.path_recipes,
+                        data={
+                            "name": "copy",
+                            "tags": [1],
+                            "ingredients": [
+                                {"id": item.id, "amount": 1}
+                                for item in ingredients[:10]
+                            ],
+                            "image": TEST_IMAGE,
+                            "cooking_time": 5,
+                            "text": "text",
+                        },
+                        format="json",
+                    )
+                self.assertEqual(
+                    response.status_code, status.HTTP_201_CREATED
+                )
+                copy = Recipe.objects.get(name="copy")
+                with patch.object(
+                    similar_index, "apply", wraps=similar_index.apply
+                ) as apply:
+                    self.assertEqual(similar_ids(base), [copy.id, close.id])
+                apply.assert_called_once()
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    close.delete()
+                self.assertEqual(similar_ids(base), [copy.id])
+                response = self.unauthorized_client.get(
+                    self.path_recipes + "0/similar/"
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_404_NOT_FOUND
+                )
+
+    def test_recipes_have_ingredients(self):
+
+        """Recipes are ranked by coverage of the supplied ingredients"""
+
+        flour, milk, eggs, salt = [
+            IngredientFactory(name=name)
+            for name in ("Мука", "Молоко", "Яйца", "Соль")
+        ]
+
+        def make_recipe(items):
+            recipe = RecipeFactory()
+            recipe.recipe_ingredients.all().delete()
+            for item in items:
+                IngredientItem.objects.create(recipe=recipe, ingredient=item)
+            return recipe
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pancakes = make_recipe([flour, milk, eggs])
+            omelette = make_recipe([milk, eggs])
+            bread = make_recipe([flour, salt])
+            make_recipe([salt])
+
+        def ids(query):
+            response = self.unauthorized_client.get(
+                self.path_recipes + f"?have={query}"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [recipe["id"] for recipe in response.data["results"]]
+
+        have = f"{flour.id},{milk.id},{eggs.id}"
+        # equal coverage falls back to the newest recipe first
+        self.assertEqual(ids(have), [omelette.id, pancakes.id])
+        self.assertEqual(
+            ids(have + "&coverage=50"), [omelette.id, pancakes.id, bread.id]
+        )
+        self.assertEqual(ids(f"{flour.id}&coverage=50"), [bread.id])
+        # filters apply before the result limit
+        author = UserFactory()
+        Recipe.objects.filter(id=pancakes.id).update(author=author)
+        with override_settings(COVERAGE_SEARCH_LIMIT=1):
+            self.assertEqual(ids(have), [omelette.id])
+            self.assertEqual(ids(have + f"&author={author.id}"), [pancakes.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientItem.objects.create(recipe=omelette, ingredient=salt)
+        # only the changed recipe is read again
+        with patch.object(coverage_index, "load") as load:
+            self.assertEqual(ids(have), [pancakes.id])
+        load.assert_not_called()
+        self.assertEqual(
+            ids(have + "&coverage=60"), [pancakes.id, omelette.id]
+        )
+        changes = CoverageChange.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            bread.delete()
+        self.assertEqual(CoverageChange.objects.count(), changes + 1)
+        self.assertEqual(ids(f"{flour.id}&coverage=50"), [])
+
+        for query in ("a,b", "1&coverage=0", "1&cursor="):
+            response = self.unauthorized_client.get(
+                self.path_recipes + f"?have={query}"
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+    def test_recipes_recommendations(self):
+
+        """Co-favorite neighbours drive per-recipe and per-user lists"""
+
+        first, second, third, lonely = RecipeFactory.create_batch(4)
+        favorites = {
+            UserFactory(): [first, second],
+            UserFactory(): [first, second, third],
+            UserFactory(): [first, third],
+            UserFactory(): [lonely],
+        }
+        for user, recipes in favorites.items():
+            for recipe in recipes:
+                Favorite.objects.create(user=user, recipe=recipe)
+
+        out = StringIO()
+        call_command("build_recommendations", chunk_size=1, stdout=out)
+        self.assertIn("Stored", out.getvalue())
+        self.assertAlmostEqual(
+            RecipeNeighbour.objects.get(recipe=first, neighbour=second).score,
+            2 / 6 ** 0.5,
+        )
+        self.assertFalse(RecipeNeighbour.objects.filter(recipe=lonely))
+
+        def ids(path, client=self.unauthorized_client):
+            response = client.get(self.path_recipes + path)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.data
+            if isinstance(data, dict):
+                data = data["results"]
+            return [recipe["id"] for recipe in data]
+
+        self.assertEqual(
+            ids(f"{first.id}/also_favorited/"), [third.id, second.id]
+        )
+        self.assertEqual(
+            ids(f"{second.id}/also_favorited/"), [first.id, third.id]
+        )
+        self.assertEqual(ids(f"{lonely.id}/also_favorited/"), [])
+
+        client = APIClient()
+        client.force_authenticate(user=list(favorites)[0])
+        self.assertEqual(ids("recommended/", client), [third.id])
+        user = UserFactory()
+        client.force_authenticate(user=user)
+        self.assertEqual(ids("recommended/", client), [])
+        Favorite.objects.create(user=user, recipe=second)
+        self.assertEqual(ids("recommended/", client), [first.id, third.id])
+
+        response = self.unauthorized_client.get(
+            self.path_recipes + "recommended/"
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(MEDIA_ROOT=tempfile.gettempdir())
+    def test_recipes_search(self):
+
+        """Full-text search covers name, ingredients and text by rank"""
+
+        author = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=author)
+        by_name = RecipeFactory(author=author, name="Песто", text="Соус")
+        by_text = RecipeFactory(
+            author=author, name="Паста", text="Подавать с соусом песто"
+        )
+        by_ingredient = RecipeFactory(author=author, name="Салат", text="")
+        # random factory ingredients would change the bm25 lengths
+        IngredientItem.objects.filter(recipe__author=author).delete()
+        update_search_index([by_name.id, by_text.id, by_ingredient.id])
+        basil = IngredientFactory(name="Базилик")
+        IngredientItem.objects.create(recipe=by_ingredient, ingredient=basil)
+
+        def ids(query):
+            response = self.unauthorized_client.get(
+                self.path_recipes + f"?author={author.id}&search={query}"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [recipe["id"] for recipe in response.data["results"]]
+
+        self.assertEqual(ids("песто"), [by_name.id, by_text.id])
+        self.assertEqual(ids("базилик"), [by_ingredient.id])
+        self.assertEqual(ids("паста соус"), [by_text.id])
+        self.assertEqual(ids("..."), [])
+
+        response = client.patch(
+            self.path_recipes + f"{by_text.id}/",
+            data={
+                "name": "Лазанья",
+                "text": "Запекать",
+                "tags": [1],
+                "ingredients": [{"id": basil.id, "amount": 5}],
+                "cooking_time": 40,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ids("песто"), [by_name.id])
+        self.assertEqual(set(ids("базилик")), {by_text.id, by_ingredient.id})
+
+        basil.name = "Руккола"
+        basil.save()
+        self.assertEqual(ids("базилик"), [])
+        self.assertEqual(set(ids("руккола")), {by_text.id, by_ingredient.id})
+
+        by_name.delete()
+        self.assertEqual(ids("песто"), [])
+
+    @override_settings(MEDIA_ROOT=tempfile.gettempdir())
+    def test_recipes_create_constant_queries(self):
+
+        """Ingredients are validated and saved with batched queries"""
+
+        client = ViewRecipeTests.authorized_client
+        ingredients = [
+            IngredientFactory(name=f"Пряность {i}") for i in range(30)
+        ]
+
+        def create(items):
+            data = {
+                "name": "batch",
+                "tags": [1],
+                "ingredients": items,
+                "image": TEST_IMAGE,
+                "cooking_time": 5,
+                "text": "text",
+            }
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post(
+                    self.path_recipes, data=data, format="json"
+                )
+            return response, len(queries)
+
+        response, few = create(
+            [{"id": item.id, "amount": 1} for item in ingredients[:3]]
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response, many = create(
+            [{"id": item.id, "amount": 2} for item in ingredients]
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(few, many)
+        recipe = Recipe.objects.filter(name="batch").latest("id")
+        self.assertEqual(recipe.recipe_ingredients.count(), 30)
+
+        count = Recipe.objects.count()
+        response, _ = create(
+            [
+                {"id": ingredients[0].id, "amount": 1},
+                {"id": ingredients[0].id, "amount": 2},
+                {"id": 0, "amount": 1},
+                {"id": -5, "amount": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["duplicates"], [str(ingredients[0].id)]
+        )
+        self.assertEqual(response.data["missing"], ["-5", "0"])
+        self.assertIn("message", response.data)
+        self.assertEqual(Recipe.objects.count(), count)
+
+    @override_settings(MEDIA_ROOT=tempfile.gettempdir())
+    def test_recipes_update_keeps_counters(self):
+
+        """Update does not overwrite counters changed during the request"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        recipe = RecipeFactory(author=user)
+        update = RecipeSerializerPost.update
+
+        def concurrent_update(serializer, instance, validated_data):
+            Favorite.objects.create(user=UserFactory(), recipe=instance)
+            Recipe.objects.filter(id=instance.id).update(rank_score=5)
+            return update(serializer, instance, validated_data)
+
+        with patch.object(RecipeSerializerPost, "update", concurrent_update):
+            response = client.put(
+                self.path_recipes + f"{recipe.id}/",
+                data={
+                    "name": "test",
+                    "tags": [1],
+                    "ingredients": [{"id": 1, "amount": 5}],
+                    "image": TEST_IMAGE,
+                    "cooking_time": 5,
+                    "text": "text",
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, "test")
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.rank_score, 5)
+
+    def test_recipes_update_constant_queries(self):
+
+        """Update applies the ingredient and tag diff in bulk"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        ingredients = [
+            IngredientFactory(name=f"Зелень {i}") for i in range(60)
+        ]
+        tags = list(RecipeTag.objects.all()[:2])
+
+        def update(size):
+            recipe = RecipeFactory(author=user)
+            recipe.tags.set(tags[:1])
+            recipe.recipe_ingredients.all().delete()
+            IngredientItem.objects.bulk_create(
+                IngredientItem(recipe=recipe, ingredient=item, amount=1)
+                for item in ingredients[:size]
+            )
+            step = size // 3
+            # keep a third, change a third, drop a third and add new ones
+            items = [
+                {"id": item.id, "amount": 1} for item in ingredients[:step]
+            ]
+            items += [
+                {"id": item.id, "amount": 7}
+                for item in ingredients[step:size - step]
+            ]
+            items += [
+                {"id": item.id, "amount": 3}
+                for item in ingredients[size:size + step]
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                response = client.put(
+                    self.path_recipes + f"{recipe.id}/",
+                    data={
+                        "name": "diff",
+                        "tags": [tag.id for tag in tags],
+                        "ingredients": items,
+                        "image": TEST_IMAGE,
+                        "cooking_time": 9,
+                        "text": "text",
+                    },
+                    format="json",
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            amounts = dict(
+                recipe.recipe_ingredients.values_list(
+                    "ingredient_id", "amount"
+                )
+            )
+            self.assertEqual(
+                amounts, {item["id"]: item["amount"] for item in items}
+            )
+            self.assertEqual(set(recipe.tags.all()), set(tags))
+            return len(queries)
+
+        self.assertEqual(update(3), update(30))
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_recipes_image_variants(self):
+
+        """Each endpoint serves the image variant it needs"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                self.path_recipes,
+                data={
+                    "name": "variants",
+                    "tags": [1],
+                    "ingredients": [
+                        {"id": Ingredient.objects.first().id, "amount": 1}
+                    ],
+                    "image": TEST_IMAGE,
+                    "cooking_time": 5,
+                    "text": "text",
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(name="variants")
+        self.assertEqual(set(recipe.image_variants), set(VARIANTS))
+        for formats in recipe.image_variants.values():
+            self.assertEqual(set(formats), {"webp", "jpeg"})
+
+        def image(path, **headers):
+            return client.get(path, **headers).data
+
+        detail = self.path_recipes + f"{recipe.id}/"
+        self.assertTrue(image(detail)["image"].endswith("_full.jpeg"))
+        self.assertTrue(
+            image(detail, HTTP_ACCEPT="image/webp,*/*")["image"].endswith(
+                "_full.webp"
+            )
+        )
+        listed = image(self.path_recipes + "?limit=50")["results"]
+        listed = next(item for item in listed if item["id"] == recipe.id)
+        self.assertTrue(listed["image"].endswith("_card.jpeg"))
+
+        subscriber = UserFactory()
+        SubscriptionFactory(subscriber=subscriber, author=user)
+        client.force_authenticate(user=subscriber)
+        subscriptions = image(reverse("users-list") + "subscriptions/")
+        self.assertTrue(
+            subscriptions["results"][0]["recipes"][0]["image"].endswith(
+                "_thumbnail.jpeg"
+            )
+        )
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_recipes_image_upload(self):
+
+        """Multipart image upload is checked before it is decoded"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        recipe = RecipeFactory(author=user)
+        path = self.path_recipes + f"{recipe.id}/image/"
+
+        def upload(content, client=client):
+            image = SimpleUploadedFile("photo.png", content)
+            return client.put(path, {"image": image}, format="multipart")
+
+        output = BytesIO()
+        Image.new("RGB", (64, 48), "green").save(output, "PNG")
+        photo = output.getvalue()
+
+        self.assertEqual(
+            upload(photo, ViewRecipeTests.unauthorized_client).status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+        self.assertEqual(
+            upload(photo, ViewRecipeTests.authorized_client).status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+        update = RecipeImageSerializer.update
+
+        def concurrent_update(serializer, instance, validated_data):
+            Favorite.objects.create(user=UserFactory(), recipe=instance)
+            return update(serializer, instance, validated_data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with patch.object(
+                RecipeImageSerializer, "update", concurrent_update
+            ):
+                response = upload(photo)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        digest = hashlib.sha256(photo).hexdigest()
+        self.assertEqual(
+            recipe.image.name,
+            f"recipes/{digest[:2]}/{digest[2:4]}/{digest}.png",
+        )
+        self.assertTrue(response.data["image"].endswith(recipe.image.name))
+        self.assertIn("thumbnail", recipe.image_variants)
+
+        with override_settings(RECIPE_IMAGE_MAX_SIZE=len(photo) - 1):
+            response = upload(photo)
+        self.assertEqual(
+            response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        with override_settings(RECIPE_IMAGE_MAX_PIXELS=64 * 48 - 1):
+            response = upload(photo)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = upload(b"not an image")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.get(id=recipe.id).image, recipe.image)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_recipes_image_deduplication(self):
+
+        """Recipes with the same photo share one file until both are gone"""
+
+        client = ViewRecipeTests.authorized_client
+        data = {
+            "name": "twins",
+            "tags": [1],
+            "ingredients": [
+                {"id": Ingredient.objects.first().id, "amount": 1}
+            ],
+            "image": TEST_IMAGE,
+            "cooking_time": 5,
+            "text": "text",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                response = client.post(
+                    self.path_recipes, data=data, format="json"
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_201_CREATED
+                )
+        first, second = Recipe.objects.filter(name="twins")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants, second.image_variants)
+        storage = first.image.storage
+        name = first.image.name
+        _, files = storage.listdir(os.path.dirname(name))
+        self.assertEqual(files, [os.path.basename(name)])
+        variant = first.image_variants["card"]["webp"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertTrue(storage.exists(variant))
+        self.assertTrue(ImageBlob.objects.filter(name=name).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete(self.path_recipes + f"{second.id}/")
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(variant))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
@@ -0,0 +1,36 @@
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+VARIANT_THUMBNAIL = "thumbnail"
+VARIANT_CARD = "card"
+VARIANT_FULL = "full"
+
+VARIANTS = {
+    VARIANT_THUMBNAIL: (160, 160),
+    VARIANT_CARD: (480, 480),
+    VARIANT_FULL: (1280, 1280),
+}
+
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+
+def render_variants(path):
+    # Runs in a worker process, so it must not touch Django. The image
+    # is read from disk here rather than sent through the pool.
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source).convert("RGB")
+
+    variants = {}
+    for variant, size in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        variants[variant] = {}
+        for extension, (image_format, options) in FORMATS.items():
+            output = BytesIO()
+            resized.save(output, image_format, **options)
+            variants[variant][extension] = output.getvalue()
+    return variants
@@ -3,9 +3,9 @@ from rest_framework.routers import DefaultRouter
 
 from recipes.views import (
     IngredientViewSet,
-    PDFCartAPIView,
     RecipeTagViewSet,
     RecipeViewSet,
+    ShoppingCartDownloadAPIView,
 )
 
 router = DefaultRouter()
@@ -15,6 +15,9 @@ router.register("ingredients", IngredientViewSet, basename="ingredients")
 
 
 urlpatterns = [
-    path("recipes/download_shopping_cart/", PDFCartAPIView.as_view()),
+    path(
+        "recipes/download_shopping_cart/",
+        ShoppingCartDownloadAPIView.as_view(),
+    ),
     path("", include(router.urls)),
 ]
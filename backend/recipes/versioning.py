@@ -0,0 +1,57 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from recipes.models import IndexVersion
+
+
+class VersionedIndex:
+    # Each process keeps its own copy of the index and reloads it when
+    # the shared version changes. The version is read at most once per
+    # INDEX_VERSION_TTL seconds, changes made by this process are seen
+    # at once.
+    name = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = None
+
+    def get_ttl(self):
+        return settings.INDEX_VERSION_TTL
+
+    def get_version(self):
+        version = (
+            IndexVersion.objects.filter(name=self.name)
+            .values_list("version", flat=True)
+            .first()
+        )
+        return version or ""
+
+    def invalidate(self, version=None):
+        IndexVersion.objects.update_or_create(
+            name=self.name, defaults={"version": version or uuid.uuid4().hex}
+        )
+        self.checked_at = None
+
+    def refresh(self):
+        now = time.monotonic()
+        if (
+            self.checked_at is not None
+            and now - self.checked_at < self.get_ttl()
+        ):
+            return
+        version = self.get_version()
+        self.checked_at = now
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            self.reload()
+            self.version = version
+
+    def reload(self):
+        raise NotImplementedError
@@ -1,17 +1,27 @@
-from django.http import HttpResponse
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import filters, permissions, serializers, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
+from recipes.coverage import coverage_index
 from recipes.filters import IngredientFilter, RecipeFilter
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (
     Cart,
     Favorite,
@@ -20,14 +30,25 @@ from recipes.models import (
     Recipe,
     RecipeTag,
 )
+from recipes.pagination import RecipePagination
+from recipes.ranking import ORDERING_POPULAR, order_recipes
+from recipes.recommendations import recommend_recipes
+from recipes.renderers import render_csv, render_pdf, render_txt
 from recipes.serializers import (
     CartSerializer,
     FavoriteSerializer,
     IngredientSerializer,
+    RecipeImageSerializer,
     RecipeSerializer,
     RecipeSerializerPost,
     RecipeTagSerialzier,
 )
+from recipes.shopping_list import get_shopping_list, get_shopping_list_hash
+from recipes.similarity import similar_index
+from recipes.uploads import LimitedUploadHandler
+from users.models import annotate_is_subscribed
+
+User = get_user_model()
 
 
 class ListDetailViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
@@ -37,33 +58,184 @@ class ListDetailViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
 class RecipeViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
 
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    read_actions = (
+        "list",
+        "retrieve",
+        "popular",
+        "similar",
+        "also_favorited",
+        "recommended",
+    )
 
     def get_queryset(self):
-        queryset = Recipe.objects.all().order_by("-id")
+        queryset = self.annotate_user_flags(Recipe.objects.all())
+        if self.action in self.read_actions:
+            queryset = self.prefetch_related_data(queryset)
         is_in_shopping_cart = self.request.query_params.get(
             "is_in_shopping_cart"
         )
         is_favorited = self.request.query_params.get("is_favorited")
-        cart = Cart.objects.filter(user=self.request.user.id)
-        favorite = Favorite.objects.filter(user=self.request.user.id)
 
         if is_in_shopping_cart == "true":
-            queryset = queryset.filter(cart__in=cart)
+            queryset = queryset.filter(is_in_shopping_cart=True)
         elif is_in_shopping_cart == "false":
-            queryset = queryset.exclude(cart__in=cart)
+            queryset = queryset.filter(is_in_shopping_cart=False)
         if is_favorited == "true":
-            queryset = queryset.filter(favorite__in=favorite)
+            queryset = queryset.filter(is_favorited=True)
         elif is_favorited == "false":
-            queryset = queryset.exclude(favorite__in=favorite)
-        return queryset.all().order_by("-id")
+            queryset = queryset.filter(is_favorited=False)
+        if self.action == "popular":
+            return order_recipes(queryset, ORDERING_POPULAR)
+        if self.action == "recommended":
+            return recommend_recipes(queryset, self.request.user)
+        return queryset.order_by("-id")
+
+    def annotate_user_flags(self, queryset):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                Cart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
+
+    def prefetch_related_data(self, queryset):
+        return queryset.prefetch_related(
+            Prefetch(
+                "author",
+                queryset=annotate_is_subscribed(
+                    User.objects.all(), self.request.user
+                ),
+            ),
+            "tags",
+            Prefetch(
+                "recipe_ingredients",
+                queryset=IngredientItem.objects.select_related("ingredient"),
+            ),
+        )
+
+    def list(self, request, *args, **kwargs):
+        if "have" not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        ingredient_ids, coverage = self.get_coverage_params(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        allowed = None
+        if queryset.query.has_filters():
+            allowed = queryset.values_list("id", flat=True)
+        scores = dict(
+            coverage_index.search(
+                ingredient_ids,
+                coverage,
+                settings.COVERAGE_SEARCH_LIMIT,
+                allowed,
+            )
+        )
+        # the index may still hold recipes deleted since its last refresh
+        allowed = set(
+            queryset.filter(id__in=scores).values_list("id", flat=True)
+        )
+        page = self.paginate_queryset(
+            [recipe_id for recipe_id in scores if recipe_id in allowed]
+        )
+        recipes = sorted(
+            queryset.filter(id__in=page),
+            key=lambda item: (-scores[item.id], -item.id),
+        )
+        serializer = self.get_serializer(recipes, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_coverage_params(self, request):
+        if self.paginator.cursor_query_param in request.query_params:
+            raise serializers.ValidationError(
+                {"cursor": "Поиск по ингредиентам не поддерживает курсор."}
+            )
+        ingredient_ids = request.query_params["have"].split(",")
+        if not all(item.isnumeric() for item in ingredient_ids):
+            raise serializers.ValidationError(
+                {"have": "Укажите id ингредиентов через запятую."}
+            )
+        coverage = request.query_params.get("coverage", "100")
+        if not coverage.isnumeric() or not 0 < int(coverage) <= 100:
+            raise serializers.ValidationError(
+                {"coverage": "Укажите процент от 1 до 100."}
+            )
+        return [int(item) for item in ingredient_ids], int(coverage) / 100
 
     def get_serializer_class(self):
-        if self.action != "list" and self.action != "retrieve":
+        if self.action not in self.read_actions:
             return RecipeSerializerPost
         return RecipeSerializer
 
+    @action(detail=False, url_path="popular", url_name="popular")
+    def popular(self, request):
+        return self.list(request)
+
+    @action(detail=True, url_path="similar", url_name="similar")
+    def similar(self, request, pk):
+        recipe = get_object_or_404(Recipe, pk=pk)
+        limit = request.query_params.get("limit")
+        if limit is not None and limit.isnumeric():
+            limit = int(limit)
+        else:
+            limit = settings.SIMILAR_RECIPES_LIMIT
+        scores = dict(similar_index.similar(recipe.id, limit))
+        recipes = sorted(
+            self.get_queryset().filter(id__in=scores),
+            key=lambda item: (-scores[item.id], -item.id),
+        )
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, url_path="also_favorited", url_name="also_favorited")
+    def also_favorited(self, request, pk):
+        recipe = get_object_or_404(Recipe, pk=pk)
+        recipes = (
+            self.get_queryset()
+            .filter(neighbour_of__recipe=recipe)
+            .order_by("-neighbour_of__score", "-id")
+        )
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        url_path="recommended",
+        url_name="recommended",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def recommended(self, request):
+        return self.list(request)
+
+    @action(
+        detail=True,
+        methods=["PUT"],
+        url_path="image",
+        url_name="image",
+        parser_classes=[MultiPartParser],
+    )
+    def image(self, request, pk):
+        recipe = get_object_or_404(Recipe, pk=pk)
+        if recipe.author_id != request.user.id:
+            raise PermissionDenied("Изменить фото может только автор рецепта.")
+        # Must be set before request.data is read for the first time.
+        request.upload_handlers = [LimitedUploadHandler(request)]
+        serializer = RecipeImageSerializer(
+            recipe, data=request.data, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
     @action(
         detail=True,
         methods=["GET", "DELETE"],
@@ -147,55 +319,86 @@ class IngredientViewSet(ModelViewSet):
     serializer_class = IngredientSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get("limit")
+        if limit is not None and limit.isnumeric():
+            limit = int(limit)
+        else:
+            limit = None
+        ingredients = ingredient_index.search(name, limit)
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
+
+
+class ExportFormatNegotiation(DefaultContentNegotiation):
+    def filter_renderers(self, renderers, format):
+        # ?format= selects the export format, not the API renderer.
+        return renderers
 
-class PDFCartAPIView(APIView):
+
+class ShoppingCartDownloadAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    content_negotiation_class = ExportFormatNegotiation
+    streaming_formats = {
+        "txt": (render_txt, "text/plain; charset=utf-8"),
+        "csv": (render_csv, "text/csv; charset=utf-8"),
+    }
 
     def get(self, request):
-        user = request.user
-        ingredients_dict = {}
-        ingredients = IngredientItem.objects.filter(recipe__cart__user=user)
-
-        for item in ingredients:
-            name = item.ingredient.name
-            measurement_unit = item.ingredient.measurement_unit
-            amount = item.amount
-            if name not in ingredients_dict:
-                ingredients_dict[name] = {
-                    "measurement_unit": measurement_unit,
-                    "amount": amount,
-                }
-            else:
-                ingredients_dict[name][amount] += amount
-        pdfmetrics.registerFont(
-            TTFont("DejaVuSerif", "DejaVuSerif.ttf", "UTF-8")
-        )
-        response = HttpResponse(content_type="application/pdf")
-        response["Content-Disposition"] = (
-            "attachment; " 'filename="shopping_list.pdf"'
-        )
-        page = canvas.Canvas(response)
-        page.setFont("DejaVuSerif", size=20)
-        page.drawString(180, 750, "Список ингредиентов:")
-        page.setFont("DejaVuSerif", size=16)
-        height = 700
-        i = 1
-
-        for name, data in ingredients_dict.items():
-            page.drawString(
-                50,
-                height,
-                (
-                    f'{i}) { name } - {data["amount"]} '
-                    f'({data["measurement_unit"]}.)'
-                ),
+        export_format = request.query_params.get("format", "pdf")
+        if export_format == "pdf":
+            response = self.get_pdf_response(request)
+        elif export_format in self.streaming_formats:
+            response = self.get_streaming_response(request, export_format)
+        else:
+            raise serializers.ValidationError(
+                {"format": "Допустимые форматы: pdf, txt, csv."}
             )
-            height -= 25
-            i += 1
 
-        page.showPage()
-        page.save()
+        if settings.SHOPPING_CART_CLEAR_ON_DOWNLOAD:
+            Cart.objects.filter(user=request.user).delete()
 
-        Cart.objects.filter(user=user).delete()
+        return response
 
+    def get_streaming_response(self, request, export_format):
+        render, content_type = self.streaming_formats[export_format]
+        ingredients = get_shopping_list(request.user).iterator()
+        if settings.SHOPPING_CART_CLEAR_ON_DOWNLOAD:
+            # The cart is cleared before the response body is consumed.
+            ingredients = list(ingredients)
+        response = StreamingHttpResponse(
+            render(ingredients), content_type=content_type
+        )
+        response["Content-Disposition"] = (
+            "attachment; " f'filename="shopping_list.{export_format}"'
+        )
         return response
+
+    def get_pdf_response(self, request):
+        ingredients = list(get_shopping_list(request.user))
+        etag = get_shopping_list_hash(ingredients)
+
+        response = get_conditional_response(request, etag=quote_etag(etag))
+        if response is None:
+            response = HttpResponse(
+                self.get_pdf_content(etag, ingredients),
+                content_type="application/pdf",
+            )
+            response["Content-Disposition"] = (
+                "attachment; " 'filename="shopping_list.pdf"'
+            )
+        response["ETag"] = quote_etag(etag)
+        return response
+
+    def get_pdf_content(self, etag, ingredients):
+        key = f"shopping-list:pdf:{etag}"
+        content = cache.get(key)
+        if content is None:
+            output = BytesIO()
+            render_pdf(ingredients, output)
+            content = output.getvalue()
+            cache.set(key, content, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+        return content
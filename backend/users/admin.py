@@ -3,10 +3,17 @@ from django.contrib.admin import register
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group, User
 
-from .models import Subscription
+from .models import OutgoingEmail, Profile, Subscription
+
+
+class ProfileInline(admin.StackedInline):
+    model = Profile
+    readonly_fields = ("recipes_count", "followers_count")
+    can_delete = False
 
 
 class UserAdmin(BaseUserAdmin):
+    inlines = [ProfileInline]
     list_display = (
         "id",
         "username",
@@ -45,6 +52,25 @@ class SubscriptionAdmin(admin.ModelAdmin):
     ]
 
 
+@register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = [
+        "subject",
+        "to",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "sent_at",
+    ]
+    search_fields = [
+        "subject",
+        "to",
+    ]
+    list_filter = [
+        "status",
+    ]
+
+
 admin.site.unregister(User)
 admin.site.unregister(Group)
 admin.site.register(User, UserAdmin)
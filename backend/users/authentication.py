@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+
+class TokenCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    @property
+    def timeout(self):
+        return getattr(settings, "TOKEN_CACHE_TIMEOUT", 60)
+
+    @property
+    def shared(self):
+        return getattr(settings, "TOKEN_CACHE_SHARED", False)
+
+    def cache_key(self, key):
+        return f"auth-token:{key}"
+
+    def get(self, key):
+        if self.shared:
+            return cache.get(self.cache_key(key))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            token, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return token
+
+    def set(self, key, token):
+        if self.shared:
+            cache.set(self.cache_key(key), token, self.timeout)
+            return
+        with self.lock:
+            self.entries[key] = (token, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > getattr(
+                settings, "TOKEN_CACHE_SIZE", 1024
+            ):
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        cache.delete(self.cache_key(key))
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_user(self, user):
+        for key in Token.objects.filter(user=user).values_list(
+            "key", flat=True
+        ):
+            self.delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is not None:
+            return (token.user, token)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, token)
+        return (user, token)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        token_cache.delete_user(instance)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
@@ -1,5 +1,4 @@
 from django.contrib.auth import backends, get_user_model
-from django.db.models import Q
 
 UserModel = get_user_model()
 
@@ -8,15 +7,18 @@ class UserOrEmailBackend(backends.ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
             username = kwargs.get(UserModel.USERNAME_FIELD)
-        try:
-            user = UserModel.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            )
-        except UserModel.DoesNotExist:
+        if username is None or password is None:
+            return None
+        # Both probes are answered by the UPPER() indexes on Postgres.
+        users = UserModel.objects.filter(username__iexact=username).union(
+            UserModel.objects.filter(email__iexact=username)
+        )
+        users = list(users)
+        if not users:
             UserModel().set_password(password)
-        else:
+        for user in users:
             if user.check_password(password) and self.user_can_authenticate(
                 user
             ):
                 return user
-        return super().authenticate(request, username, password, **kwargs)
+        return None
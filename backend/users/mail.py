@@ -0,0 +1,107 @@
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import OutgoingEmail
+
+
+def enqueue_email(subject, body, from_email, to, html_body=""):
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or "",
+        to=list(to),
+    )
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject,
+        email.body,
+        email.from_email or None,
+        email.to,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+def record_failure(email, error, max_attempts, retry_delay):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = OutgoingEmail.FAILED
+    else:
+        email.next_attempt_at = timezone.now() + timedelta(
+            seconds=retry_delay * 2 ** (email.attempts - 1)
+        )
+
+
+def claim_emails(batch_size, claim_timeout):
+    # Claimed emails are hidden from other workers until the claim runs
+    # out, so a worker killed mid-batch only resends the unrecorded ones.
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(
+                status=OutgoingEmail.PENDING,
+                next_attempt_at__lte=timezone.now(),
+            )
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        OutgoingEmail.objects.filter(
+            id__in=[email.id for email in emails]
+        ).update(
+            next_attempt_at=timezone.now() + timedelta(seconds=claim_timeout)
+        )
+    return emails
+
+
+def send_queued_mail(batch_size=100):
+    max_attempts = getattr(settings, "EMAIL_QUEUE_MAX_ATTEMPTS", 5)
+    retry_delay = getattr(settings, "EMAIL_QUEUE_RETRY_DELAY", 60)
+    claim_timeout = getattr(settings, "EMAIL_QUEUE_CLAIM_TIMEOUT", 600)
+    sent = failed = 0
+
+    emails = claim_emails(batch_size, claim_timeout)
+    if not emails:
+        return sent, failed
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except (OSError, smtplib.SMTPException) as error:
+        # An outage is not an attempt to deliver, the caller backs off.
+        OutgoingEmail.objects.filter(
+            id__in=[email.id for email in emails]
+        ).update(next_attempt_at=timezone.now(), last_error=str(error))
+        raise
+    try:
+        for email in emails:
+            try:
+                build_message(email, connection).send()
+            except Exception as error:
+                record_failure(email, error, max_attempts, retry_delay)
+                failed += 1
+            else:
+                email.status = OutgoingEmail.SENT
+                email.sent_at = timezone.now()
+                sent += 1
+            email.save(
+                update_fields=[
+                    "status",
+                    "attempts",
+                    "next_attempt_at",
+                    "last_error",
+                    "sent_at",
+                ]
+            )
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,57 @@
+import smtplib
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.mail import send_queued_mail
+
+MAX_BACKOFF = 300
+
+
+class Command(BaseCommand):
+    help = "Send queued emails in batches over one SMTP connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Emails sent per connection",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the queue",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between polls in --loop mode",
+        )
+
+    def handle(self, *args, **options):
+        failures = 0
+        while True:
+            try:
+                sent, failed = send_queued_mail(options["batch_size"])
+            except (OSError, smtplib.SMTPException) as error:
+                if not options["loop"]:
+                    raise CommandError(f"SMTP connection failed: {error}")
+                failures += 1
+                delay = min(options["interval"] * 2 ** failures, MAX_BACKOFF)
+                self.stderr.write(
+                    f"SMTP connection failed: {error}, retry in {delay:g}s"
+                )
+                time.sleep(delay)
+                continue
+            if sent:
+                failures = 0
+            if sent or failed:
+                self.stdout.write(
+                    self.style.SUCCESS(f"{sent} sent, {failed} failed")
+                )
+            if not options["loop"]:
+                break
+            if not sent and not failed:
+                time.sleep(options["interval"])
@@ -1,6 +1,13 @@
 from django.contrib.auth import get_user_model
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (
+    BooleanField,
+    Exists,
+    OuterRef,
+    UniqueConstraint,
+    Value,
+)
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -35,3 +42,90 @@ class Subscription(models.Model):
 
     def __str__(self) -> str:
         return self.author.username
+
+
+class Profile(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name="profile",
+        verbose_name="Пользователь",
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0, verbose_name="Рецептов"
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name="Подписчиков"
+    )
+
+    class Meta:
+        verbose_name = "Профиль"
+        verbose_name_plural = "Профили"
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        return self.user.username
+
+
+class OutgoingEmail(models.Model):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "В очереди"),
+        (SENT, "Отправлено"),
+        (FAILED, "Ошибка"),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(verbose_name="Текст")
+    html_body = models.TextField(blank=True, verbose_name="HTML")
+    from_email = models.CharField(
+        max_length=255, blank=True, verbose_name="Отправитель"
+    )
+    to = models.JSONField(verbose_name="Получатели")
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name="Статус",
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name="Попытки"
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Следующая попытка"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name="Создано"
+    )
+    sent_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Отправлено"
+    )
+
+    class Meta:
+        verbose_name = "Письмо"
+        verbose_name_plural = "Очередь писем"
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"],
+                name="outgoing_email_due_idx",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return self.subject
+
+
+def annotate_is_subscribed(queryset, user):
+    if not user.is_authenticated:
+        return queryset.annotate(
+            is_subscribed=Value(False, output_field=BooleanField())
+        )
+    return queryset.annotate(
+        is_subscribed=Exists(
+            Subscription.objects.filter(subscriber=user, author=OuterRef("pk"))
+        )
+    )
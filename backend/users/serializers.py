@@ -28,6 +28,8 @@ class UserSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         try:
             request = self.context.get("request")
             subscription = Subscription.objects.filter(
@@ -109,19 +111,26 @@ class AuthorSerializer(UserSerializer):
     def get_recipes(self, obj):
         from recipes.serializers import RecipeSubscriptionSerializer
 
-        request = self.context["request"]
-        recipes_limit = request.query_params.get("recipes_limit")
-        queryset = Recipe.objects.filter(author=obj)
+        author_recipes = self.context.get("author_recipes")
+        if author_recipes is not None:
+            queryset = author_recipes.get(obj.id, [])
+        else:
+            request = self.context["request"]
+            recipes_limit = request.query_params.get("recipes_limit")
+            queryset = Recipe.objects.filter(author=obj)
 
-        if recipes_limit is not None and recipes_limit.isnumeric():
-            recipes_limit = int(recipes_limit)
-            queryset = queryset[:recipes_limit]
+            if recipes_limit is not None and recipes_limit.isnumeric():
+                recipes_limit = int(recipes_limit)
+                queryset = queryset[:recipes_limit]
 
-        return [RecipeSubscriptionSerializer(el).data for el in queryset]
+        return RecipeSubscriptionSerializer(
+            queryset, many=True, context=self.context
+        ).data
 
     def get_recipes_count(self, obj):
-        qset = Recipe.objects.filter(author=obj)
-        return qset.count()
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
+        return obj.profile.recipes_count
 
 
 class ChangePasswordSerializer(serializers.Serializer):
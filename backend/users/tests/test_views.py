@@ -1,6 +1,15 @@
-from django.contrib.auth import get_user_model
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import authenticate, get_user_model
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import CommandError, call_command
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APITestCase
 
 from recipes.tests.factories import (
@@ -8,7 +17,8 @@ from recipes.tests.factories import (
     RecipeFactory,
     RecipeTagFactory,
 )
-from users.models import Subscription
+from users.authentication import token_cache
+from users.models import OutgoingEmail, Profile, Subscription
 
 from .factories import SubscriptionFactory, UserFactory
 
@@ -218,6 +228,10 @@ class ViewUsersTests(APITestCase):
             Subscription.objects.filter(subscriber=user).count(),
             subscription + 1,
         )
+        followers = Profile.objects.get(user=1).followers_count
+        self.assertEqual(
+            followers, Subscription.objects.filter(author=1).count()
+        )
         response = client.get(
             path=self.path_users + "1/subscribe/",
         )
@@ -240,6 +254,9 @@ class ViewUsersTests(APITestCase):
         self.assertEqual(
             Subscription.objects.filter(subscriber=user).count(), subscription
         )
+        self.assertEqual(
+            Profile.objects.get(user=1).followers_count, followers - 1
+        )
         response = client.delete(
             path=self.path_users + "1/subscribe/",
         )
@@ -344,3 +361,243 @@ class ViewUsersTests(APITestCase):
         self.assertTrue(
             client.login(username=user.username, password="Test1!1Test")
         )
+
+    def test_backend_single_query(self):
+
+        """Login lookup by username or email takes one query"""
+
+        user = UserFactory()
+        for username in (user.username, user.email.upper()):
+            with self.subTest(username=username), self.assertNumQueries(1):
+                self.assertEqual(
+                    authenticate(username=username, password="Test1!1Test"),
+                    user,
+                )
+        with self.assertNumQueries(1):
+            self.assertIsNone(
+                authenticate(username=user.email, password="wrong")
+            )
+        with self.assertNumQueries(1):
+            self.assertIsNone(
+                authenticate(username="missing", password="Test1!1Test")
+            )
+
+    def test_users_subscriptions_constant_queries(self):
+
+        """Subscriptions serialize only the current page in fixed queries"""
+
+        user = UserFactory()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        authors = UserFactory.create_batch(12)
+        for author in authors:
+            SubscriptionFactory(subscriber=user, author=author)
+        for author in authors[:3]:
+            RecipeFactory.create_batch(3, author=author)
+
+        # count, authors page, recipes of the page
+        with self.assertNumQueries(3):
+            response_data = client.get(
+                ViewUsersTests.path_users + "subscriptions/?recipes_limit=2"
+            ).data
+
+        self.assertEqual(response_data["count"], 12)
+        self.assertEqual(len(response_data["results"]), 10)
+        for result in response_data["results"]:
+            author = User.objects.get(id=result["id"])
+            recipes = list(
+                author.recipe_set.order_by("-id").values_list("id", flat=True)
+            )
+            with self.subTest(author=author.id):
+                self.assertTrue(result["is_subscribed"])
+                self.assertEqual(result["recipes_count"], len(recipes))
+                self.assertEqual(
+                    [recipe["id"] for recipe in result["recipes"]],
+                    recipes[:2],
+                )
+
+        response_data = client.get(
+            ViewUsersTests.path_users + "subscriptions/?page=2"
+        ).data
+        self.assertEqual(len(response_data["results"]), 2)
+
+    def test_users_subscriptions_empty(self):
+
+        """A user without subscriptions gets an empty page"""
+
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        response = client.get(
+            ViewUsersTests.path_users + "subscriptions/?recipes_limit=3"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 0)
+        self.assertEqual(response.data["results"], [])
+
+    def test_cached_token_authentication(self):
+
+        """Token is cached and invalidated on logout, password change
+        and deactivation"""
+
+        token_cache.clear()
+        user = UserFactory()
+        client = APIClient()
+
+        def login():
+            client.credentials()
+            response = client.post(
+                "/api/auth/token/login/",
+                {"email": user.email, "password": password},
+                format="json",
+            )
+            client.credentials(
+                HTTP_AUTHORIZATION="Token " + response.data["auth_token"]
+            )
+
+        password = "Test1!1Test"
+        login()
+        path_me = ViewUsersTests.path_users + "me/"
+        response = client.get(path_me)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1):
+            response = client.get(path_me)
+        self.assertEqual(response.data["id"], user.id)
+
+        response = client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = client.get(path_me)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        login()
+        client.get(path_me)
+        response = client.post(
+            ViewUsersTests.path_users + "set_password/",
+            {"current_password": password, "new_password": "Test1!1Test11"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        password = "Test1!1Test11"
+        Token.objects.filter(user=user).update(key="0" * 40)
+        response = client.get(path_me)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        client.credentials(HTTP_AUTHORIZATION="Token " + "0" * 40)
+        client.get(path_me)
+        user.is_active = False
+        user.save()
+        response = client.get(path_me)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_reset_email_queued(self):
+
+        """Password reset email is queued and sent by the worker"""
+
+        user = UserFactory()
+        response = ViewUsersTests.unauthorized_client.post(
+            "/api/auth/reset_password/", {"email": user.email}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get(to=[user.email])
+        self.assertEqual(email.status, OutgoingEmail.PENDING)
+
+        with patch(
+            "django.core.mail.EmailMultiAlternatives.send",
+            side_effect=OSError("SMTP down"),
+        ):
+            call_command("send_queued_mail", stdout=StringIO())
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, "SMTP down")
+        self.assertTrue(email.next_attempt_at > timezone.now())
+
+        call_command("send_queued_mail", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        call_command("send_queued_mail", stdout=StringIO())
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.SENT)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [user.email])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+
+    @override_settings(EMAIL_QUEUE_MAX_ATTEMPTS=1)
+    def test_send_queued_mail_connection_error(self):
+
+        """SMTP outage backs off the worker without spending attempts"""
+
+        email = OutgoingEmail.objects.create(
+            subject="subject", body="body", to=["test@test.test"]
+        )
+        with patch(
+            "django.core.mail.backends.locmem.EmailBackend.open",
+            side_effect=ConnectionRefusedError("refused"),
+        ):
+            with self.assertRaises(CommandError):
+                call_command("send_queued_mail", stdout=StringIO())
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, 0)
+            self.assertEqual(email.last_error, "refused")
+            self.assertTrue(email.next_attempt_at <= timezone.now())
+
+            stderr = StringIO()
+            with patch(
+                "users.management.commands.send_queued_mail.time.sleep",
+                side_effect=[None, KeyboardInterrupt],
+            ) as sleep:
+                with self.assertRaises(KeyboardInterrupt):
+                    call_command(
+                        "send_queued_mail",
+                        "--loop",
+                        "--interval=1",
+                        stdout=StringIO(),
+                        stderr=stderr,
+                    )
+        self.assertEqual(
+            [call.args for call in sleep.mock_calls], [(2,), (4,)]
+        )
+        self.assertIn("SMTP connection failed", stderr.getvalue())
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 0)
+        self.assertEqual(email.status, OutgoingEmail.PENDING)
+
+        call_command("send_queued_mail", stdout=StringIO())
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.SENT)
+
+    def test_send_queued_mail_killed_worker(self):
+
+        """Emails sent before a worker dies are not sent again"""
+
+        first, second = [
+            OutgoingEmail.objects.create(
+                subject="subject", body="body", to=[f"{name}@test.test"]
+            )
+            for name in ("first", "second")
+        ]
+        send = EmailMultiAlternatives.send
+
+        def send_and_die(message):
+            if message.to == second.to:
+                raise SystemExit
+            return send(message)
+
+        with patch.object(EmailMultiAlternatives, "send", send_and_die):
+            with self.assertRaises(SystemExit):
+                call_command("send_queued_mail", stdout=StringIO())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, OutgoingEmail.SENT)
+        self.assertEqual(second.status, OutgoingEmail.PENDING)
+        # the claim keeps the second email from other workers for a while
+        self.assertTrue(second.next_attempt_at > timezone.now())
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        call_command("send_queued_mail", stdout=StringIO())
+        second.refresh_from_db()
+        self.assertEqual(second.status, OutgoingEmail.SENT)
+        self.assertEqual(
+            [message.to for message in mail.outbox], [first.to, second.to]
+        )
@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.mail import EmailMultiAlternatives
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.dispatch import receiver
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
@@ -18,7 +19,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from .models import Subscription
+from recipes.models import Recipe
+
+from .authentication import token_cache
+from .mail import enqueue_email
+from .models import Subscription, annotate_is_subscribed
 from .serializers import (
     AuthorSerializer,
     ChangePasswordSerializer,
@@ -31,6 +36,28 @@ from .serializers import (
 User = get_user_model()
 
 
+def get_author_recipes(author_ids, limit=None):
+    if not author_ids:
+        # An empty IN () has no SQL to embed in the raw query below.
+        return Recipe.objects.none()
+    queryset = Recipe.objects.filter(author__in=author_ids)
+    if limit is None:
+        return queryset.order_by("-id")
+    ranked = queryset.order_by().annotate(
+        author_row=Window(
+            expression=RowNumber(),
+            partition_by=[F("author")],
+            order_by=F("id").desc(),
+        )
+    )
+    sql, params = ranked.query.sql_with_params()
+    return Recipe.objects.raw(
+        f"SELECT * FROM ({sql}) ranked WHERE author_row <= %s "
+        "ORDER BY id DESC",
+        [*params, limit],
+    )
+
+
 class CreateListDestroyViewSet(
     CreateModelMixin, ListModelMixin, DestroyModelMixin, GenericViewSet
 ):
@@ -59,6 +86,7 @@ class LogoutAPIView(APIView):
     def post(self, request):
         token = get_object_or_404(Token, user=request.user)
         token.delete()
+        token_cache.delete(token.key)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -131,20 +159,37 @@ class UserViewSet(ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def subscriptions(self, request):
-        subscriber = User.objects.filter(
-            author__in=request.user.subscriber.all()
-        ).order_by("id")
-        page = self.paginate_queryset(subscriber)
+        authors = annotate_is_subscribed(
+            User.objects.filter(author__subscriber=request.user),
+            request.user,
+        ).annotate(recipes_count=F("profile__recipes_count")).order_by("id")
+        page = self.paginate_queryset(authors)
         if page is not None:
             serializer = AuthorSerializer(
-                subscriber, many=True, context={"request": request}
+                page,
+                many=True,
+                context=self.get_author_context(request, page),
             )
             return self.get_paginated_response(serializer.data)
         serializer = AuthorSerializer(
-            subscriber, many=True, context={"request": request}
+            authors,
+            many=True,
+            context=self.get_author_context(request, authors),
         )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def get_author_context(self, request, authors):
+        recipes_limit = request.query_params.get("recipes_limit")
+        if recipes_limit is not None and recipes_limit.isnumeric():
+            recipes_limit = int(recipes_limit)
+        else:
+            recipes_limit = None
+
+        author_recipes = {author.id: [] for author in authors}
+        for recipe in get_author_recipes(list(author_recipes), recipes_limit):
+            author_recipes[recipe.author_id].append(recipe)
+        return {"request": request, "author_recipes": author_recipes}
+
     @action(
         detail=False,
         methods=["POST"],
@@ -168,7 +213,7 @@ class UserViewSet(ModelViewSet):
 def password_reset_token_created(
     sender, instance, reset_password_token, *args, **kwargs
 ):
-    # send an e-mail to the user
+    # queue an e-mail to the user
     context = {
         "current_user": reset_password_token.user,
         "username": reset_password_token.user.username,
@@ -187,7 +232,7 @@ def password_reset_token_created(
         "user_reset_password.txt", context
     )
 
-    msg = EmailMultiAlternatives(
+    enqueue_email(
         # title:
         "Password Reset for {title}".format(title="Foodgram"),
         # message:
@@ -196,6 +241,5 @@ def password_reset_token_created(
         settings.EMAIL_HOST_USER,
         # to:
         [reset_password_token.user.email],
+        html_body=email_html_message,
     )
-    msg.attach_alternative(email_html_message, "text/html")
-    msg.send()